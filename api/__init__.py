@@ -3,14 +3,19 @@
 import json
 import os
 from enum import StrEnum
+from typing import Optional, Mapping, NamedTuple, Iterable, AsyncIterator, Callable, Awaitable, TYPE_CHECKING
 import aiohttp
 import asyncio
 
 from _decimal import Decimal
-from aiohttp_socks import ProxyConnector
-from dotenv import load_dotenv
 
-from utils import get_time_now_iso_8601, calc_ok_access_sign
+from api.models import json_loads, iter_json_array, ApiError, TokenInfo, LiquiditySource
+from utils import OkAccessSigner, release_session
+
+if TYPE_CHECKING:
+    from api.scheduler import RequestScheduler
+    from api.credentials import CredentialPool
+    from utils.instrument import Instrumentation
 
 DOMAIN_NAME = "https://web3.okx.com"
 
@@ -20,114 +25,407 @@ class SwapMode(StrEnum):
     exactOut: str = "exactOut"
 
 
-# chain
-async def get_aggregator_supported_chain(api_key: str, secret_key: str, pass_phrase: str,
-                                         chain_idx: int, timeout: int) -> dict:
-    request_path = "/api/v5/dex/aggregator/supported/chain?chainIndex={}".format(chain_idx)
-    ts_iso_8601 = get_time_now_iso_8601()
-    ok_access_sign = calc_ok_access_sign(secret_key, ts_iso_8601, "GET", request_path)
-    headers = {
-        "OK-ACCESS-KEY": api_key,
-        "OK-ACCESS-SIGN": ok_access_sign,
-        "OK-ACCESS-PASSPHRASE": pass_phrase,
-        "OK-ACCESS-TIMESTAMP": ts_iso_8601,
-    }
-    url = "".join([DOMAIN_NAME, request_path])
+class Endpoint(NamedTuple):
+    method: str
+    path: str
+    params: tuple[str, ...]
+    # path with the query string laid out once, values are filled in per request
+    template: str
+
+    def build(self, *values) -> str:
+        return self.template.format(*values) if values else self.template
+
+
+def make_endpoint(method: str, path: str, *params: str) -> Endpoint:
+    template = path.replace("{", "{{").replace("}", "}}")
+    if params:
+        template += "?" + "&".join("{}={{}}".format(param) for param in params)
+    return Endpoint(method, path, params, template)
+
+
+ENDPOINTS: dict[str, Endpoint] = {
+    "supported_chain": make_endpoint("GET", "/api/v5/dex/aggregator/supported/chain", "chainIndex"),
+    "all_tokens": make_endpoint("GET", "/api/v5/dex/aggregator/all-tokens", "chainIndex"),
+    "liquidity": make_endpoint("GET", "/api/v5/dex/aggregator/get-liquidity", "chainIndex"),
+    "approve_transaction": make_endpoint("GET", "/api/v5/dex/aggregator/approve-transaction",
+                                         "chainIndex", "tokenContractAddress", "approveAmount"),
+    "quote": make_endpoint("GET", "/api/v5/dex/aggregator/quote",
+                           "chainIndex", "swapMode", "amount", "fromTokenAddress", "toTokenAddress", "slippage"),
+    "swap": make_endpoint("GET", "/api/v5/dex/aggregator/swap",
+                          "chainIndex", "swapMode", "amount", "fromTokenAddress", "toTokenAddress",
+                          "userWalletAddress", "slippage"),
+    "history": make_endpoint("GET", "/api/v5/dex/aggregator/history", "chainIndex", "txHash"),
+    "gas_limit": make_endpoint("POST", "/api/v5/dex/pre-transaction/gas-limit"),
+}
+
+
+class QuoteSpec(NamedTuple):
+    chain_idx: int
+    swap_mode: SwapMode
+    amount: int
+    from_token_contract_addr: str
+    to_token_contract_addr: str
+    slippage: Decimal
+
+
+class QuoteOutcome(NamedTuple):
+    spec: QuoteSpec
+    result: Optional[dict] = None
+    error: Optional[BaseException] = None
+
+
+async def _check_stream_status(response: aiohttp.ClientResponse,
+                              answer: list[tuple[int, Mapping[str, str], dict]]) -> None:
+    # an error answer is small and never streamed: it is read whole and raised like the decoded payload
+    # of a non-streaming call, the parser would otherwise take it for an empty result
+    if response.status < 400:
+        answer.append((response.status, response.headers, {}))
+        return
+    try:
+        payload = json_loads(await response.read())
+    except ValueError:
+        payload = None
+    answer.append((response.status, response.headers, payload if isinstance(payload, dict) else {}))
+    if isinstance(payload, dict) and payload.get("code") not in (None, "", "0", 0):
+        raise ApiError(str(payload["code"]), payload.get("msg"))
+    raise ApiError("http_{}".format(response.status), response.reason)
+
+
+class OKXDexClient:
+    # one long-lived keep-alive session shared by every endpoint call
+    def __init__(self, api_key: str, secret_key: str, pass_phrase: str,
+                 timeout: int = 5, proxy_url: Optional[str] = None,
+                 limit: int = 100, limit_per_host: int = 0,
+                 ttl_dns_cache: Optional[int] = 300, keepalive_timeout: float = 30.0,
+                 domain_name: str = DOMAIN_NAME, scheduler: Optional["RequestScheduler"] = None,
+                 instrumentation: Optional["Instrumentation"] = None,
+                 credential_pool: Optional["CredentialPool"] = None):
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.pass_phrase = pass_phrase
+        self.timeout = timeout
+        self.proxy_url = proxy_url if proxy_url is not None else os.getenv("CLIENT_PROXY")
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.domain_name = domain_name
+        self.scheduler = scheduler
+        self.instrumentation = instrumentation
+        # takes over signing from the api_key / secret_key / pass_phrase set when given
+        self.credential_pool = credential_pool
+
+        self._signer = OkAccessSigner(api_key, secret_key, pass_phrase)
+        self._client_timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def __aenter__(self) -> "OKXDexClient":
+        await self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    def _create_connector(self) -> aiohttp.BaseConnector:
+        connector_kwargs = {
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "ttl_dns_cache": self.ttl_dns_cache,
+            "keepalive_timeout": self.keepalive_timeout,
+        }
+        if self.proxy_url is not None and self.proxy_url != "":
+            # imported on first use, most deployments never set a proxy
+            from aiohttp_socks import ProxyConnector
+            return ProxyConnector.from_url(self.proxy_url, **connector_kwargs)
+        return aiohttp.TCPConnector(**connector_kwargs)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        # a session is bound to the loop it was created on, so a new loop (another asyncio.run) needs a new one
+        if self._session is None or self._session.closed or self._loop is not loop:
+            release_session(self._session, self._loop)
+            trace_configs = [self.instrumentation.trace_config()] if self.instrumentation is not None else None
+            self._session = aiohttp.ClientSession(connector=self._create_connector(), trace_configs=trace_configs)
+            self._loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        else:
+            release_session(self._session, self._loop)
+        self._session = None
+        self._loop = None
+
+    async def _request(self, endpoint: "Endpoint", query: tuple = (), body: Optional[dict] = None,
+                       timeout: Optional[int] = None) -> dict:
+        request_path = endpoint.build(*query)
+        # serialize once, the signed bytes are the sent bytes
+        data = None if body is None else json.dumps(body, separators=(",", ":")).encode()
+        if self.scheduler is None:
+            _, _, payload = await self._send(endpoint.method, request_path, data, timeout)
+            return payload
+        # the scheduler may retry, every attempt is signed with a fresh timestamp
+        on_retry = None
+        if self.instrumentation is not None:
+            def on_retry(attempt: int, delay: float) -> None:
+                self.instrumentation.retry("api", endpoint.path, attempt, delay)
+        return await self.scheduler.submit(request_path,
+                                           lambda: self._send(endpoint.method, request_path, data, timeout),
+                                           on_retry)
+
+    async def _send(self, method: str, request_path: str, data: Optional[bytes] = None,
+                    timeout: Optional[int] = None) -> tuple[int, Mapping[str, str], dict]:
+        # with a credential pool every attempt is signed by the key with the most headroom
+        credential = None
+        if self.credential_pool is None:
+            headers = self._signer.headers(method, request_path, data)
+        else:
+            credential = await self.credential_pool.acquire()
+            headers = credential.signer.headers(method, request_path, data)
+        url = self.domain_name + request_path
+
+        client_timeout = self._client_timeout if timeout is None else aiohttp.ClientTimeout(total=timeout)
+
+        result = None
+        try:
+            session = await self._get_session()
+            if self.instrumentation is None:
+                async with session.request(method, url, headers=headers, data=data,
+                                           timeout=client_timeout) as response:
+                    result = response.status, response.headers, json_loads(await response.read())
+            else:
+                result = await self._send_instrumented(session, method, url, request_path, headers, data,
+                                                       client_timeout)
+            return result
+        finally:
+            if credential is not None:
+                self.credential_pool.record(credential, result)
+
+    async def _send_instrumented(self, session: aiohttp.ClientSession, method: str, url: str, request_path: str,
+                                 headers: dict, data: Optional[bytes],
+                                 client_timeout: aiohttp.ClientTimeout) -> tuple[int, Mapping[str, str], dict]:
+        ctx = self.instrumentation.start("api", request_path.split("?", 1)[0])
+        status = None
+        error_code = None
+        try:
+            async with session.request(method, url, headers=headers, data=data, timeout=client_timeout,
+                                       trace_request_ctx=ctx) as response:
+                status = response.status
+                payload = json_loads(await response.read())
+            code = payload.get("code") if isinstance(payload, dict) else None
+            if code is not None and str(code) != "0":
+                error_code = str(code)
+            elif status >= 400:
+                error_code = "http_{}".format(status)
+            return status, response.headers, payload
+        except BaseException as ex:
+            error_code = type(ex).__name__
+            raise
+        finally:
+            self.instrumentation.finish(ctx, status, error_code)
+
+    async def _stream(self, endpoint: "Endpoint", query: tuple = (), timeout: Optional[int] = None,
+                      chunk_size: int = 65536) -> AsyncIterator[bytes]:
+        request_path = endpoint.build(*query)
+        credential = None
+        if self.credential_pool is None:
+            headers = self._signer.headers(endpoint.method, request_path)
+        else:
+            credential = await self.credential_pool.acquire()
+            headers = credential.signer.headers(endpoint.method, request_path)
+        url = self.domain_name + request_path
+
+        client_timeout = self._client_timeout if timeout is None else aiohttp.ClientTimeout(total=timeout)
+
+        # status and headers of the answer, the streamed body itself is never held for the credential pool
+        answer: list[tuple[int, Mapping[str, str], dict]] = []
+        try:
+            async for chunk in self._stream_chunks(endpoint, url, headers, client_timeout, chunk_size, answer):
+                yield chunk
+        finally:
+            if credential is not None:
+                self.credential_pool.record(credential, answer[0] if answer else None)
+
+    async def _stream_chunks(self, endpoint: "Endpoint", url: str, headers: dict,
+                             client_timeout: aiohttp.ClientTimeout, chunk_size: int,
+                             answer: list[tuple[int, Mapping[str, str], dict]]) -> AsyncIterator[bytes]:
+        session = await self._get_session()
+        if self.instrumentation is None:
+            async with session.request(endpoint.method, url, headers=headers, timeout=client_timeout) as response:
+                await _check_stream_status(response, answer)
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    yield chunk
+            return
+
+        ctx = self.instrumentation.start("api", endpoint.path)
+        status = None
+        error_code = None
+        try:
+            async with session.request(endpoint.method, url, headers=headers, timeout=client_timeout,
+                                       trace_request_ctx=ctx) as response:
+                status = response.status
+                if status >= 400:
+                    error_code = "http_{}".format(status)
+                await _check_stream_status(response, answer)
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    yield chunk
+        except BaseException as ex:
+            # GeneratorExit only means the consumer stopped early
+            if not isinstance(ex, GeneratorExit) and error_code is None:
+                error_code = type(ex).__name__
+            raise
+        finally:
+            self.instrumentation.finish(ctx, status, error_code)
+
+    # chain
+    async def get_aggregator_supported_chain(self, chain_idx: int, timeout: Optional[int] = None) -> dict:
+        return await self._request(ENDPOINTS["supported_chain"], (chain_idx,), timeout=timeout)
+
+    # all-tokens
+    async def get_aggregator_all_tokens(self, chain_idx: int, timeout: Optional[int] = None) -> dict:
+        return await self._request(ENDPOINTS["all_tokens"], (chain_idx,), timeout=timeout)
+
+    async def iter_aggregator_all_tokens(self, chain_idx: int, timeout: Optional[int] = None) -> AsyncIterator[TokenInfo]:
+        # streaming parse, tokens are yielded without holding the whole document
+        async for item in iter_json_array(self._stream(ENDPOINTS["all_tokens"], (chain_idx,), timeout)):
+            yield TokenInfo.from_dict(item)
+
+    # get-liquidity
+    async def get_aggregator_liquidity(self, chain_idx: int, timeout: Optional[int] = None) -> dict:
+        return await self._request(ENDPOINTS["liquidity"], (chain_idx,), timeout=timeout)
+
+    async def iter_aggregator_liquidity(self, chain_idx: int,
+                                        timeout: Optional[int] = None) -> AsyncIterator[LiquiditySource]:
+        async for item in iter_json_array(self._stream(ENDPOINTS["liquidity"], (chain_idx,), timeout)):
+            yield LiquiditySource.from_dict(item)
+
+    # approve-transaction
+    async def get_approve_transaction(self, chain_idx: int, token_contract_addr: str, approve_amount: str,
+                                      timeout: Optional[int] = None) -> dict:
+        return await self._request(ENDPOINTS["approve_transaction"],
+                                   (chain_idx, token_contract_addr, approve_amount), timeout=timeout)
+
+    # quote
+    async def get_aggregator_quote(self, chain_idx: int, swap_mode: SwapMode, amount: int,
+                                   from_token_contract_addr: str, to_token_contract_addr: str, slippage: Decimal,
+                                   timeout: Optional[int] = None) -> dict:
+        # SwapMode: exactIn => amount: sell exact amount
+        # SwapMode: exactOut => amount: buy exact amount
+        return await self._request(ENDPOINTS["quote"],
+                                   (chain_idx, swap_mode.value, amount, from_token_contract_addr,
+                                    to_token_contract_addr, slippage), timeout=timeout)
+
+    async def get_aggregator_swap(self, chain_idx: int, swap_mode: SwapMode, amount: int,
+                                  from_token_contract_addr: str, to_token_contract_addr: str,
+                                  user_addr: str, slippage: Decimal,
+                                  timeout: Optional[int] = None) -> dict:
+        # SwapMode: exactIn => amount: sell exact amount
+        # SwapMode: exactOut => amount: buy exact amount
+        return await self._request(ENDPOINTS["swap"],
+                                   (chain_idx, swap_mode.value, amount, from_token_contract_addr,
+                                    to_token_contract_addr, user_addr, slippage), timeout=timeout)
+
+    # history
+    async def get_aggregator_history(self, chain_idx: int, tx_hash: str, timeout: Optional[int] = None) -> dict:
+        return await self._request(ENDPOINTS["history"], (chain_idx, tx_hash), timeout=timeout)
+
+    async def quote_many(self, specs: Iterable[QuoteSpec], concurrency: int = 16, timeout: Optional[int] = None,
+                         fetch: Optional[Callable[..., Awaitable[dict]]] = None) -> AsyncIterator[QuoteOutcome]:
+        # yields outcomes in completion order, at most `concurrency` specs are pulled from the iterable at a time
+        if fetch is None:
+            fetch = self.get_aggregator_quote
+
+        async def run(spec: QuoteSpec) -> QuoteOutcome:
+            try:
+                return QuoteOutcome(spec, await fetch(*spec, timeout=timeout))
+            except Exception as ex:
+                return QuoteOutcome(spec, error=ex)
+
+        spec_iter = iter(specs)
+        exhausted = False
+        pending: set[asyncio.Task] = set()
+        try:
+            while True:
+                while not exhausted and len(pending) < concurrency:
+                    spec = next(spec_iter, None)
+                    if spec is None:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(run(spec)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            # consumer stopped early or was cancelled
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def get_gas_limit(self, chain_idx: int, from_addr: str, to_addr: str,
+                            value: int, input_data: str, timeout: Optional[int] = None) -> dict:
+        body = {
+            "chainIndex": chain_idx,
+            "fromAddress": from_addr,
+            "toAddress": to_addr,
+            "txAmount": value,
+            "extJson": {
+                "inputData": input_data,
+            }
+        }
+        return await self._request(ENDPOINTS["gas_limit"], body=body, timeout=timeout)
 
-    connector = None
-    proxy_url = os.getenv("CLIENT_PROXY")
 
-    if proxy_url is not None and proxy_url != "":
-        connector = ProxyConnector.from_url(proxy_url)
+# module level functions share one client per credential set
+_default_clients: dict[tuple[str, str, str], OKXDexClient] = {}
 
-    client_timeout = aiohttp.ClientTimeout(total=timeout)
 
-    async with aiohttp.ClientSession(connector=connector) as session:
-        async with session.get(url, headers=headers, timeout=client_timeout) as response:
-            return await response.json()
+def get_default_client(api_key: str, secret_key: str, pass_phrase: str) -> OKXDexClient:
+    key = (api_key, secret_key, pass_phrase)
+    client = _default_clients.get(key)
+    if client is None:
+        client = OKXDexClient(api_key, secret_key, pass_phrase)
+        _default_clients[key] = client
+    return client
 
 
-# all-tokens
-async def get_aggregator_all_tokens(api_key: str, secret_key: str, pass_phrase: str,
-                                    chain_idx: int, timeout: int) -> dict:
-    request_path = "/api/v5/dex/aggregator/all-tokens?chainIndex={}".format(chain_idx)
-    ts_iso_8601 = get_time_now_iso_8601()
-    ok_access_sign = calc_ok_access_sign(secret_key, ts_iso_8601, "GET", request_path)
-    headers = {
-        "OK-ACCESS-KEY": api_key,
-        "OK-ACCESS-SIGN": ok_access_sign,
-        "OK-ACCESS-PASSPHRASE": pass_phrase,
-        "OK-ACCESS-TIMESTAMP": ts_iso_8601,
-    }
-    url = "".join([DOMAIN_NAME, request_path])
+async def close_default_clients() -> None:
+    for client in list(_default_clients.values()):
+        await client.close()
+    _default_clients.clear()
 
-    connector = None
-    proxy_url = os.getenv("CLIENT_PROXY")
 
-    if proxy_url is not None and proxy_url != "":
-        connector = ProxyConnector.from_url(proxy_url)
+# chain
+async def get_aggregator_supported_chain(api_key: str, secret_key: str, pass_phrase: str,
+                                         chain_idx: int, timeout: int) -> dict:
+    client = get_default_client(api_key, secret_key, pass_phrase)
+    return await client.get_aggregator_supported_chain(chain_idx, timeout)
 
-    client_timeout = aiohttp.ClientTimeout(total=timeout)
 
-    async with aiohttp.ClientSession(connector=connector) as session:
-        async with session.get(url, headers=headers, timeout=client_timeout) as response:
-            return await response.json()
+# all-tokens
+async def get_aggregator_all_tokens(api_key: str, secret_key: str, pass_phrase: str,
+                                    chain_idx: int, timeout: int) -> dict:
+    client = get_default_client(api_key, secret_key, pass_phrase)
+    return await client.get_aggregator_all_tokens(chain_idx, timeout)
 
 
 # get-liquidity
 async def get_aggregator_liquidity(api_key: str, secret_key: str, pass_phrase: str,
                                    chain_idx: int, timeout: int) -> dict:
-    request_path = "/api/v5/dex/aggregator/get-liquidity?chainIndex={}".format(chain_idx)
-    ts_iso_8601 = get_time_now_iso_8601()
-    ok_access_sign = calc_ok_access_sign(secret_key, ts_iso_8601, "GET", request_path)
-    headers = {
-        "OK-ACCESS-KEY": api_key,
-        "OK-ACCESS-SIGN": ok_access_sign,
-        "OK-ACCESS-PASSPHRASE": pass_phrase,
-        "OK-ACCESS-TIMESTAMP": ts_iso_8601,
-    }
-    url = "".join([DOMAIN_NAME, request_path])
-
-    connector = None
-    proxy_url = os.getenv("CLIENT_PROXY")
-
-    if proxy_url is not None and proxy_url != "":
-        connector = ProxyConnector.from_url(proxy_url)
-
-    client_timeout = aiohttp.ClientTimeout(total=timeout)
-
-    async with aiohttp.ClientSession(connector=connector) as session:
-        async with session.get(url, headers=headers, timeout=client_timeout) as response:
-            return await response.json()
+    client = get_default_client(api_key, secret_key, pass_phrase)
+    return await client.get_aggregator_liquidity(chain_idx, timeout)
 
 
 # approve-transaction
 async def get_approve_transaction(api_key: str, secret_key: str, pass_phrase: str,
                                   chain_idx: int, token_contract_addr: str,
                                   approve_amount: str, timeout: int) -> dict:
-    request_path = "/api/v5/dex/aggregator/approve-transaction?chainIndex={}&tokenContractAddress={}&approveAmount={}".format(
-        chain_idx, token_contract_addr, approve_amount)
-    ts_iso_8601 = get_time_now_iso_8601()
-    ok_access_sign = calc_ok_access_sign(secret_key, ts_iso_8601, "GET", request_path)
-    headers = {
-        "OK-ACCESS-KEY": api_key,
-        "OK-ACCESS-SIGN": ok_access_sign,
-        "OK-ACCESS-PASSPHRASE": pass_phrase,
-        "OK-ACCESS-TIMESTAMP": ts_iso_8601,
-    }
-    url = "".join([DOMAIN_NAME, request_path])
-
-    connector = None
-    proxy_url = os.getenv("CLIENT_PROXY")
-
-    if proxy_url is not None and proxy_url != "":
-        connector = ProxyConnector.from_url(proxy_url)
-
-    client_timeout = aiohttp.ClientTimeout(total=timeout)
-
-    async with aiohttp.ClientSession(connector=connector) as session:
-        async with session.get(url, headers=headers, timeout=client_timeout) as response:
-            return await response.json()
+    client = get_default_client(api_key, secret_key, pass_phrase)
+    return await client.get_approve_transaction(chain_idx, token_contract_addr, approve_amount, timeout)
 
 
 # quote
@@ -135,31 +433,10 @@ async def get_aggregator_quote(api_key: str, secret_key: str, pass_phrase: str,
                                chain_idx: int, swap_mode: SwapMode, amount: int,
                                from_token_contract_addr: str, to_token_contract_addr: str, slippage: Decimal,
                                timeout: int) -> dict:
-    # SwapMode: exactIn => amount: sell exact amount
-    # SwapMode: exactOut => amount: buy exact amount
-    request_path = "/api/v5/dex/aggregator/quote?chainIndex={}&swapMode={}&amount={}&fromTokenAddress={}&toTokenAddress={}&slippage={}".format(
-        chain_idx, swap_mode.value, amount, from_token_contract_addr, to_token_contract_addr, slippage)
-    ts_iso_8601 = get_time_now_iso_8601()
-    ok_access_sign = calc_ok_access_sign(secret_key, ts_iso_8601, "GET", request_path)
-    headers = {
-        "OK-ACCESS-KEY": api_key,
-        "OK-ACCESS-SIGN": ok_access_sign,
-        "OK-ACCESS-PASSPHRASE": pass_phrase,
-        "OK-ACCESS-TIMESTAMP": ts_iso_8601,
-    }
-    url = "".join([DOMAIN_NAME, request_path])
-
-    connector = None
-    proxy_url = os.getenv("CLIENT_PROXY")
-
-    if proxy_url is not None and proxy_url != "":
-        connector = ProxyConnector.from_url(proxy_url)
-
-    client_timeout = aiohttp.ClientTimeout(total=timeout)
-
-    async with aiohttp.ClientSession(connector=connector) as session:
-        async with session.get(url, headers=headers, timeout=client_timeout) as response:
-            return await response.json()
+    client = get_default_client(api_key, secret_key, pass_phrase)
+    return await client.get_aggregator_quote(chain_idx, swap_mode, amount,
+                                             from_token_contract_addr, to_token_contract_addr, slippage,
+                                             timeout)
 
 
 async def get_aggregator_swap(api_key: str, secret_key: str, pass_phrase: str,
@@ -167,96 +444,24 @@ async def get_aggregator_swap(api_key: str, secret_key: str, pass_phrase: str,
                               from_token_contract_addr: str, to_token_contract_addr: str,
                               user_addr: str, slippage: Decimal,
                               timeout: int) -> dict:
-    # SwapMode: exactIn => amount: sell exact amount
-    # SwapMode: exactOut => amount: buy exact amount
-    request_path = "/api/v5/dex/aggregator/swap?chainIndex={}&swapMode={}&amount={}&fromTokenAddress={}&toTokenAddress={}&userWalletAddress={}&slippage={}".format(
-        chain_idx, swap_mode.value, amount, from_token_contract_addr, to_token_contract_addr, user_addr, slippage)
-    ts_iso_8601 = get_time_now_iso_8601()
-    ok_access_sign = calc_ok_access_sign(secret_key, ts_iso_8601, "GET", request_path)
-    headers = {
-        "OK-ACCESS-KEY": api_key,
-        "OK-ACCESS-SIGN": ok_access_sign,
-        "OK-ACCESS-PASSPHRASE": pass_phrase,
-        "OK-ACCESS-TIMESTAMP": ts_iso_8601,
-    }
-    url = "".join([DOMAIN_NAME, request_path])
-
-    connector = None
-    proxy_url = os.getenv("CLIENT_PROXY")
-
-    if proxy_url is not None and proxy_url != "":
-        connector = ProxyConnector.from_url(proxy_url)
-
-    client_timeout = aiohttp.ClientTimeout(total=timeout)
-
-    async with aiohttp.ClientSession(connector=connector) as session:
-        async with session.get(url, headers=headers, timeout=client_timeout) as response:
-            return await response.json()
+    client = get_default_client(api_key, secret_key, pass_phrase)
+    return await client.get_aggregator_swap(chain_idx, swap_mode, amount,
+                                            from_token_contract_addr, to_token_contract_addr,
+                                            user_addr, slippage, timeout)
 
 
 # history
 async def get_aggregator_history(api_key: str, secret_key: str, pass_phrase: str,
                                  chain_idx: int, tx_hash: str, timeout: int) -> dict:
-    request_path = "/api/v5/dex/aggregator/history?chainIndex={}&txHash={}".format(chain_idx, tx_hash)
-    ts_iso_8601 = get_time_now_iso_8601()
-    ok_access_sign = calc_ok_access_sign(secret_key, ts_iso_8601, "GET", request_path)
-    headers = {
-        "OK-ACCESS-KEY": api_key,
-        "OK-ACCESS-SIGN": ok_access_sign,
-        "OK-ACCESS-PASSPHRASE": pass_phrase,
-        "OK-ACCESS-TIMESTAMP": ts_iso_8601,
-    }
-    url = "".join([DOMAIN_NAME, request_path])
-
-    connector = None
-    proxy_url = os.getenv("CLIENT_PROXY")
-
-    if proxy_url is not None and proxy_url != "":
-        connector = ProxyConnector.from_url(proxy_url)
-
-    client_timeout = aiohttp.ClientTimeout(total=timeout)
-
-    async with aiohttp.ClientSession(connector=connector) as session:
-        async with session.get(url, headers=headers, timeout=client_timeout) as response:
-            return await response.json()
+    client = get_default_client(api_key, secret_key, pass_phrase)
+    return await client.get_aggregator_history(chain_idx, tx_hash, timeout)
 
 
 async def get_gas_limit(api_key: str, secret_key: str, pass_phrase: str,
                         chain_idx: int, from_addr: str, to_addr: str,
                         value: int, input_data: str, timeout: int) -> dict:
-    request_path = "/api/v5/dex/pre-transaction/gas-limit"
-    ts_iso_8601 = get_time_now_iso_8601()
-
-    body = {
-        "chainIndex": chain_idx,
-        "fromAddress": from_addr,
-        "toAddress": to_addr,
-        "txAmount": value,
-        "extJson": {
-            "inputData": input_data,
-        }
-    }
-
-    ok_access_sign = calc_ok_access_sign(secret_key, ts_iso_8601, "POST", request_path, json.dumps(body))
-    headers = {
-        "OK-ACCESS-KEY": api_key,
-        "OK-ACCESS-SIGN": ok_access_sign,
-        "OK-ACCESS-PASSPHRASE": pass_phrase,
-        "OK-ACCESS-TIMESTAMP": ts_iso_8601,
-    }
-    url = "".join([DOMAIN_NAME, request_path])
-
-    connector = None
-    proxy_url = os.getenv("CLIENT_PROXY")
-
-    if proxy_url is not None and proxy_url != "":
-        connector = ProxyConnector.from_url(proxy_url)
-
-    client_timeout = aiohttp.ClientTimeout(total=timeout)
-
-    async with aiohttp.ClientSession(connector=connector) as session:
-        async with session.post(url, headers=headers, json=body, timeout=client_timeout) as response:
-            return await response.json()
+    client = get_default_client(api_key, secret_key, pass_phrase)
+    return await client.get_gas_limit(chain_idx, from_addr, to_addr, value, input_data, timeout)
 
 
 # async def broadcast_transaction(api_key: str, secret_key: str, pass_phrase: str,
@@ -293,6 +498,8 @@ async def get_gas_limit(api_key: str, secret_key: str, pass_phrase: str,
 
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+
     async def func(api_key: str, secret_key: str, pass_phrase: str):
         timeout = 10
         r = await get_aggregator_supported_chain(api_key, secret_key, pass_phrase, 1, timeout)
@@ -360,6 +567,13 @@ if __name__ == "__main__":
     secretkey = str(os.getenv("API_SECRET"))
     passphrase = str(os.getenv("API_PASSPHRASE"))
 
-    # asyncio.run(func(apikey, secretkey, passphrase))
-    # asyncio.run(func2(apikey, secretkey, passphrase))
-    asyncio.run(func3(apikey, secretkey, passphrase))
+    async def run(coro):
+        try:
+            await coro
+        finally:
+            await close_default_clients()
+
+
+    # asyncio.run(run(func(apikey, secretkey, passphrase)))
+    # asyncio.run(run(func2(apikey, secretkey, passphrase)))
+    asyncio.run(run(func3(apikey, secretkey, passphrase)))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Optional, Iterable
+
+from api.scheduler import RATE_LIMIT_CODES, SendResult
+from utils import OkAccessSigner
+
+
+class Credential:
+    # one OKX API key set with its recent usage
+    def __init__(self, api_key: str, secret_key: str, pass_phrase: str):
+        self.api_key = api_key
+        self.signer = OkAccessSigner(api_key, secret_key, pass_phrase)
+        # completion times within the rate window, stamped when the answer arrives so the window
+        # is never shorter than the one the server sees
+        self.sent: deque[float] = deque()
+        self.in_flight = 0
+        # error times within the error window
+        self.errors: deque[float] = deque()
+        self.quarantined_until = 0.0
+        # consecutive rate-limit answers, the quarantine doubles with each
+        self.strikes = 0
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self.last_used = 0.0
+
+
+class CredentialPool:
+    # each request is signed with the key that has the most headroom, rate limited keys sit out a while.
+    # aggregate throughput is rate * number of keys
+    def __init__(self, credentials: Iterable[tuple[str, str, str]], rate: float = 10.0, window: float = 1.0,
+                 quarantine: float = 1.0, max_quarantine: float = 30.0, error_window: float = 60.0,
+                 error_weight: float = 1.0):
+        self.credentials = [Credential(*credential) for credential in credentials]
+        if not self.credentials:
+            raise ValueError("credential pool is empty")
+        # requests per second allowed per key
+        self.rate = rate
+        self.window = window
+        self.quarantine = quarantine
+        self.max_quarantine = max_quarantine
+        self.error_window = error_window
+        # headroom taken off per recent error
+        self.error_weight = error_weight
+
+    def __len__(self) -> int:
+        return len(self.credentials)
+
+    def _trim(self, credential: Credential, now: float) -> None:
+        while credential.sent and now - credential.sent[0] >= self.window:
+            credential.sent.popleft()
+        while credential.errors and now - credential.errors[0] >= self.error_window:
+            credential.errors.popleft()
+
+    def headroom(self, credential: Credential, now: Optional[float] = None) -> float:
+        # requests the key may still send in the current window
+        now = time.monotonic() if now is None else now
+        self._trim(credential, now)
+        return self.rate * self.window - len(credential.sent) - credential.in_flight
+
+    def _best(self, now: float) -> Optional[Credential]:
+        # most headroom among the keys not in quarantine, recent errors count against a key,
+        # least recently used on a tie
+        best = None
+        best_key = None
+        for credential in self.credentials:
+            if credential.quarantined_until > now:
+                continue
+            headroom = self.headroom(credential, now)
+            if headroom < 1:
+                continue
+            key = (headroom - self.error_weight * len(credential.errors), -credential.last_used)
+            if best_key is None or key > best_key:
+                best, best_key = credential, key
+        return best
+
+    def _next_free(self, now: float) -> float:
+        # seconds until some key can send again
+        waits = []
+        for credential in self.credentials:
+            wait = credential.quarantined_until - now
+            headroom = self.headroom(credential, now)
+            if headroom < 1:
+                # same test as _best, a fractional rate * window leaves headroom between 0 and 1.
+                # the next token is due once the oldest ceil(1 - headroom) completions leave the window,
+                # in-flight requests free their slot one window after they complete, poll until then
+                due = math.ceil(1 - headroom) - 1
+                if due < len(credential.sent):
+                    wait = max(wait, credential.sent[due] + self.window - now)
+                else:
+                    wait = max(wait, self.window / 10)
+            waits.append(wait)
+        return max(0.001, min(waits))
+
+    async def acquire(self) -> Credential:
+        # waits while every key is saturated or quarantined instead of burning requests on 429s
+        while True:
+            now = time.monotonic()
+            credential = self._best(now)
+            if credential is not None:
+                credential.in_flight += 1
+                credential.last_used = now
+                credential.request_count += 1
+                return credential
+            await asyncio.sleep(self._next_free(now))
+
+    def record(self, credential: Credential, result: Optional[SendResult]) -> None:
+        # result is None when no answer arrived, the request may still have counted on the server
+        now = time.monotonic()
+        credential.in_flight -= 1
+        credential.sent.append(now)
+        if result is None:
+            return
+        status, headers, payload = result
+        code = str(payload.get("code")) if isinstance(payload, dict) else None
+        if status == 429 or code in RATE_LIMIT_CODES:
+            credential.rate_limited_count += 1
+            credential.errors.append(now)
+            delay = min(self.max_quarantine, self.quarantine * 2 ** credential.strikes)
+            retry_after = headers.get("Retry-After")
+            if retry_after is not None:
+                try:
+                    delay = min(self.max_quarantine, max(delay, float(retry_after)))
+                except ValueError:
+                    pass
+            credential.strikes += 1
+            credential.quarantined_until = max(credential.quarantined_until, now + delay)
+        elif status >= 400 or (code is not None and code != "0"):
+            credential.errors.append(now)
+        else:
+            credential.strikes = 0
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "api_key": credential.api_key,
+                "headroom": self.headroom(credential, now),
+                "in_flight": credential.in_flight,
+                "quarantined_for": max(0.0, credential.quarantined_until - now),
+                "requests": credential.request_count,
+                "rate_limited": credential.rate_limited_count,
+                "recent_errors": len(credential.errors),
+            }
+            for credential in self.credentials
+        ]
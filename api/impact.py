@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import time
+from typing import Optional, NamedTuple, Iterable
+
+from _decimal import Decimal
+
+from api import OKXDexClient, SwapMode, QuoteSpec
+
+PairKey = tuple[int, str, str, str]
+
+
+def make_ladder(min_amount: int, max_amount: int, steps: int = 8) -> list[int]:
+    # geometric ladder, impact grows with size so small sizes need the denser sampling
+    if steps < 2 or min_amount >= max_amount:
+        return [max_amount]
+    ratio = (max_amount / min_amount) ** (1 / (steps - 1))
+    return sorted({max(1, int(min_amount * ratio ** i)) for i in range(steps - 1)} | {max_amount})
+
+
+def quote_value(swap_mode: SwapMode, payload: dict) -> Optional[int]:
+    # exactIn => tokens received for the amount sold, exactOut => tokens paid for the amount bought
+    if payload.get("code") != "0" or not payload.get("data"):
+        return None
+    data = payload["data"][0]
+    value = data.get("toTokenAmount") if swap_mode == SwapMode.exactIn else data.get("fromTokenAmount")
+    return int(value) if value not in (None, "") else None
+
+
+class CurveEstimate(NamedTuple):
+    amount: int
+    value: int
+    # the true quote lies in [lower, upper] as long as the curve keeps its curvature between rungs
+    lower: int
+    upper: int
+    # relative to the mid price of the smallest rung, positive means worse than mid
+    price_impact: float
+    # seconds since the ladder was quoted / since the mid price was last confirmed
+    age: float
+    probe_age: float
+
+    @property
+    def error(self) -> float:
+        return (self.upper - self.lower) / self.value if self.value else 0.0
+
+
+class ImpactCurve:
+    # monotone cubic (Fritsch-Carlson) through (0, 0) and the ladder quotes
+    def __init__(self, swap_mode: SwapMode, points: Iterable[tuple[int, int]], built_at: Optional[float] = None):
+        self.swap_mode = swap_mode
+        self.built_at = time.monotonic() if built_at is None else built_at
+        self.probed_at = self.built_at
+
+        xs = [0]
+        ys = [0]
+        for amount, value in sorted(points):
+            if amount <= xs[-1]:
+                continue
+            # aggregator routes are noisy, keep the curve non-decreasing
+            xs.append(amount)
+            ys.append(max(value, ys[-1]))
+        if len(xs) < 2:
+            raise ValueError("impact curve needs at least one quoted amount")
+        self.xs = xs
+        self.ys = ys
+        # secant slopes and hermite tangents
+        self.d = [(ys[k + 1] - ys[k]) / (xs[k + 1] - xs[k]) for k in range(len(xs) - 1)]
+        self.m = self._tangents()
+        self.mid_price = self.d[0]
+        if self.mid_price <= 0:
+            raise ValueError("impact curve needs a non-zero quote at the smallest amount")
+
+    def _tangents(self) -> list[float]:
+        xs, d = self.xs, self.d
+        m = [d[0]] + [0.0] * (len(d) - 1) + [d[-1]]
+        for k in range(1, len(d)):
+            if d[k - 1] * d[k] <= 0:
+                continue
+            h0, h1 = xs[k] - xs[k - 1], xs[k + 1] - xs[k]
+            w1, w2 = 2 * h1 + h0, h1 + 2 * h0
+            m[k] = (w1 + w2) / (w1 / d[k - 1] + w2 / d[k])
+        return m
+
+    @property
+    def max_amount(self) -> int:
+        return self.xs[-1]
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (time.monotonic() if now is None else now) - self.built_at
+
+    def _segment(self, amount: int) -> int:
+        lo, hi = 0, len(self.xs) - 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self.xs[mid] <= amount:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def estimate(self, amount: int, now: Optional[float] = None) -> Optional[CurveEstimate]:
+        # None outside the quoted range, the curve does not extrapolate
+        if amount <= 0 or amount > self.max_amount:
+            return None
+        now = time.monotonic() if now is None else now
+        xs, ys, d, m = self.xs, self.ys, self.d, self.m
+        i = self._segment(amount)
+        if amount == xs[i]:
+            value = lower = upper = float(ys[i])
+        else:
+            h = xs[i + 1] - xs[i]
+            t = (amount - xs[i]) / h
+            t2, t3 = t * t, t * t * t
+            value = ((2 * t3 - 3 * t2 + 1) * ys[i] + (t3 - 2 * t2 + t) * h * m[i]
+                     + (-2 * t3 + 3 * t2) * ys[i + 1] + (t3 - t2) * h * m[i + 1])
+
+            # between two rungs a concave curve lies between the chord and the extended neighbour secants,
+            # a convex one (exactOut) the other way round
+            chord = ys[i] + d[i] * (amount - xs[i])
+            extended = []
+            if i > 0:
+                extended.append(ys[i] + d[i - 1] * (amount - xs[i]))
+            if i + 1 < len(d):
+                extended.append(ys[i + 1] - d[i + 1] * (xs[i + 1] - amount))
+            concave = d[i - 1] >= d[i] if i > 0 else (d[i] >= d[i + 1] if i + 1 < len(d) else True)
+            if not extended:
+                lower = upper = chord
+            elif concave:
+                lower, upper = chord, max(chord, min(extended))
+            else:
+                lower, upper = min(chord, max(extended)), chord
+            value = min(max(value, lower), upper)
+
+        price = value / amount
+        if self.swap_mode == SwapMode.exactIn:
+            impact = 1 - price / self.mid_price
+        else:
+            impact = price / self.mid_price - 1
+        return CurveEstimate(amount, int(value), int(lower), int(upper), impact, now - self.built_at,
+                             now - self.probed_at)
+
+
+class ImpactCurveCache:
+    # per pair and swap mode: quote a ladder once, answer any size inside it locally, re-quote the ladder
+    # only when the smallest rung shows the mid price moved past mid_threshold or the curve is max_age old
+    def __init__(self, client: OKXDexClient, slippage: Decimal = Decimal("0.005"), max_age: float = 60.0,
+                 probe_interval: float = 5.0, mid_threshold: float = 0.002, steps: int = 8,
+                 concurrency: int = 8, timeout: Optional[int] = None):
+        self.client = client
+        self.slippage = slippage
+        self.max_age = max_age
+        self.probe_interval = probe_interval
+        self.mid_threshold = mid_threshold
+        self.steps = steps
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+        self.local = 0
+        self.builds = 0
+        self.probes = 0
+        self.fallbacks = 0
+        self.upstream = 0
+
+        self._ladders: dict[PairKey, list[int]] = {}
+        self._curves: dict[PairKey, ImpactCurve] = {}
+        self._inflight: dict[PairKey, asyncio.Task] = {}
+
+    @staticmethod
+    def make_key(chain_idx: int, swap_mode: SwapMode, from_token_contract_addr: str,
+                 to_token_contract_addr: str) -> PairKey:
+        return chain_idx, swap_mode.value, from_token_contract_addr.lower(), to_token_contract_addr.lower()
+
+    def add_pair(self, chain_idx: int, from_token_contract_addr: str, to_token_contract_addr: str,
+                 exact_in_ladder: Optional[Iterable[int]] = None,
+                 exact_out_ladder: Optional[Iterable[int]] = None) -> None:
+        # exactIn amounts are in from-token units, exactOut amounts in to-token units
+        for swap_mode, ladder in ((SwapMode.exactIn, exact_in_ladder), (SwapMode.exactOut, exact_out_ladder)):
+            if ladder is not None:
+                key = self.make_key(chain_idx, swap_mode, from_token_contract_addr, to_token_contract_addr)
+                self._ladders[key] = sorted(set(int(amount) for amount in ladder))
+                self._curves.pop(key, None)
+
+    def curve(self, chain_idx: int, swap_mode: SwapMode, from_token_contract_addr: str,
+              to_token_contract_addr: str) -> Optional[ImpactCurve]:
+        return self._curves.get(self.make_key(chain_idx, swap_mode, from_token_contract_addr,
+                                              to_token_contract_addr))
+
+    async def _quote_ladder(self, key: PairKey, ladder: list[int]) -> list[tuple[int, int]]:
+        chain_idx, swap_mode, from_addr, to_addr = key
+        specs = [QuoteSpec(chain_idx, SwapMode(swap_mode), amount, from_addr, to_addr, self.slippage)
+                 for amount in ladder]
+        points = []
+        async for outcome in self.client.quote_many(specs, self.concurrency, self.timeout):
+            self.upstream += 1
+            value = quote_value(SwapMode(swap_mode), outcome.result) if outcome.result is not None else None
+            if value is not None:
+                points.append((outcome.spec.amount, value))
+        return points
+
+    async def _build(self, key: PairKey) -> ImpactCurve:
+        self.builds += 1
+        curve = ImpactCurve(SwapMode(key[1]), await self._quote_ladder(key, self._ladders[key]))
+        self._curves[key] = curve
+        return curve
+
+    async def _probe(self, key: PairKey, curve: ImpactCurve) -> ImpactCurve:
+        # one quote at the smallest rung decides whether the whole ladder is re-quoted
+        self.probes += 1
+        points = await self._quote_ladder(key, [curve.xs[1]])
+        if points:
+            amount, value = points[0]
+            if abs(value / amount / curve.mid_price - 1) <= self.mid_threshold:
+                curve.probed_at = time.monotonic()
+                return curve
+        return await self._build(key)
+
+    async def _fresh(self, key: PairKey) -> ImpactCurve:
+        curve = self._curves.get(key)
+        now = time.monotonic()
+        if curve is not None and curve.age(now) < self.max_age and now - curve.probed_at < self.probe_interval:
+            return curve
+        task = self._inflight.get(key)
+        if task is None:
+            if curve is None or curve.age(now) >= self.max_age:
+                task = asyncio.ensure_future(self._build(key))
+            else:
+                task = asyncio.ensure_future(self._probe(key, curve))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def refresh(self, chain_idx: int, from_token_contract_addr: str, to_token_contract_addr: str) -> None:
+        # re-quote the ladders of both swap modes
+        keys = [self.make_key(chain_idx, swap_mode, from_token_contract_addr, to_token_contract_addr)
+                for swap_mode in SwapMode]
+        await asyncio.gather(*[self._build(key) for key in keys if key in self._ladders])
+
+    async def estimate(self, chain_idx: int, swap_mode: SwapMode, amount: int, from_token_contract_addr: str,
+                       to_token_contract_addr: str) -> CurveEstimate:
+        key = self.make_key(chain_idx, swap_mode, from_token_contract_addr, to_token_contract_addr)
+        if key not in self._ladders:
+            # no ladder configured, sample two decades around the first asked amount
+            self._ladders[key] = make_ladder(max(1, amount // 100), amount * 10, self.steps)
+        curve = await self._fresh(key)
+        res = curve.estimate(amount)
+        if res is not None:
+            self.local += 1
+            return res
+
+        # outside the ladder, ask upstream directly
+        self.fallbacks += 1
+        self.upstream += 1
+        payload = await self.client.get_aggregator_quote(chain_idx, swap_mode, amount, from_token_contract_addr,
+                                                         to_token_contract_addr, self.slippage, self.timeout)
+        value = quote_value(swap_mode, payload)
+        if value is None:
+            raise ValueError("quote failed: {} {}".format(payload.get("code"), payload.get("msg")))
+        price = value / amount
+        impact = 1 - price / curve.mid_price if swap_mode == SwapMode.exactIn else price / curve.mid_price - 1
+        return CurveEstimate(amount, value, value, value, impact, 0.0, 0.0)
+
+    def stats(self) -> dict:
+        return {
+            "curves": len(self._curves),
+            "local": self.local,
+            "builds": self.builds,
+            "probes": self.probes,
+            "fallbacks": self.fallbacks,
+            "upstream_quotes": self.upstream,
+        }
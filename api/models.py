@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import codecs
+import json
+import re
+from typing import Optional, Any, AsyncIterator, Callable
+
+from _decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# bytes or str => python objects, orjson when it is installed
+json_loads: Callable[[Any], Any] = orjson.loads if orjson is not None else json.loads
+
+
+class ApiError(Exception):
+    def __init__(self, code: Optional[str], msg: Optional[str]):
+        super().__init__("OKX DEX API error {}: {}".format(code, msg))
+        self.code = code
+        self.msg = msg
+
+
+def _int(value: Any) -> int:
+    return int(value) if value not in (None, "") else 0
+
+
+def _decimal(value: Any) -> Optional[Decimal]:
+    return Decimal(value) if value not in (None, "") else None
+
+
+class _Slotted:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "{}({})".format(type(self).__name__,
+                               ", ".join("{}={!r}".format(k, getattr(self, k)) for k in self.__slots__))
+
+    def __eq__(self, other: Any) -> bool:
+        return type(self) is type(other) and all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+
+class TokenInfo(_Slotted):
+    __slots__ = ("address", "symbol", "name", "decimals", "logo_url", "unit_price")
+
+    def __init__(self, address: str, symbol: str, name: str, decimals: int, logo_url: str = "",
+                 unit_price: Optional[Decimal] = None):
+        self.address = address
+        self.symbol = symbol
+        self.name = name
+        self.decimals = decimals
+        self.logo_url = logo_url
+        self.unit_price = unit_price
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "TokenInfo":
+        return cls(d.get("tokenContractAddress", ""), d.get("tokenSymbol", ""), d.get("tokenName", ""),
+                   _int(d.get("decimals", d.get("decimal"))), d.get("tokenLogoUrl", ""),
+                   _decimal(d.get("tokenUnitPrice")))
+
+
+class QuoteResult(_Slotted):
+    __slots__ = ("chain_idx", "from_token", "to_token", "from_token_amount", "to_token_amount",
+                 "trade_fee", "estimate_gas_fee", "price_impact_percentage", "dex_router_list")
+
+    def __init__(self, chain_idx: int, from_token: TokenInfo, to_token: TokenInfo, from_token_amount: int,
+                 to_token_amount: int, trade_fee: Optional[Decimal], estimate_gas_fee: int,
+                 price_impact_percentage: Optional[Decimal], dex_router_list: list):
+        self.chain_idx = chain_idx
+        self.from_token = from_token
+        self.to_token = to_token
+        self.from_token_amount = from_token_amount
+        self.to_token_amount = to_token_amount
+        self.trade_fee = trade_fee
+        self.estimate_gas_fee = estimate_gas_fee
+        self.price_impact_percentage = price_impact_percentage
+        self.dex_router_list = dex_router_list
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "QuoteResult":
+        return cls(_int(d.get("chainIndex", d.get("chainId"))), TokenInfo.from_dict(d.get("fromToken") or {}),
+                   TokenInfo.from_dict(d.get("toToken") or {}), _int(d.get("fromTokenAmount")),
+                   _int(d.get("toTokenAmount")), _decimal(d.get("tradeFee")), _int(d.get("estimateGasFee")),
+                   _decimal(d.get("priceImpactPercentage")), d.get("dexRouterList") or [])
+
+
+class SwapTx(_Slotted):
+    __slots__ = ("from_addr", "to_addr", "data", "value", "gas", "gas_price", "max_priority_fee_per_gas",
+                 "min_receive_amount", "slippage")
+
+    def __init__(self, from_addr: str, to_addr: str, data: str, value: int, gas: int, gas_price: int,
+                 max_priority_fee_per_gas: int, min_receive_amount: int, slippage: Optional[Decimal]):
+        self.from_addr = from_addr
+        self.to_addr = to_addr
+        self.data = data
+        self.value = value
+        self.gas = gas
+        self.gas_price = gas_price
+        self.max_priority_fee_per_gas = max_priority_fee_per_gas
+        self.min_receive_amount = min_receive_amount
+        self.slippage = slippage
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "SwapTx":
+        return cls(d.get("from", ""), d.get("to", ""), d.get("data", ""), _int(d.get("value")), _int(d.get("gas")),
+                   _int(d.get("gasPrice")), _int(d.get("maxPriorityFeePerGas")), _int(d.get("minReceiveAmount")),
+                   _decimal(d.get("slippage")))
+
+
+class SwapData(_Slotted):
+    __slots__ = ("router_result", "tx")
+
+    def __init__(self, router_result: QuoteResult, tx: SwapTx):
+        self.router_result = router_result
+        self.tx = tx
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "SwapData":
+        return cls(QuoteResult.from_dict(d.get("routerResult") or {}), SwapTx.from_dict(d.get("tx") or {}))
+
+
+class LiquiditySource(_Slotted):
+    __slots__ = ("id", "name", "logo")
+
+    def __init__(self, id: str, name: str, logo: str = ""):
+        self.id = id
+        self.name = name
+        self.logo = logo
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "LiquiditySource":
+        return cls(d.get("id", ""), d.get("name", ""), d.get("logo", ""))
+
+
+class ChainInfo(_Slotted):
+    __slots__ = ("chain_idx", "chain_name", "dex_token_approve_address")
+
+    def __init__(self, chain_idx: int, chain_name: str, dex_token_approve_address: str):
+        self.chain_idx = chain_idx
+        self.chain_name = chain_name
+        self.dex_token_approve_address = dex_token_approve_address
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "ChainInfo":
+        return cls(_int(d.get("chainIndex", d.get("chainId"))), d.get("chainName", ""),
+                   d.get("dexTokenApproveAddress", ""))
+
+
+def _data(payload: dict) -> list:
+    if str(payload.get("code")) != "0":
+        raise ApiError(payload.get("code"), payload.get("msg"))
+    return payload.get("data") or []
+
+
+def decode_quote(payload: dict) -> list[QuoteResult]:
+    return [QuoteResult.from_dict(d) for d in _data(payload)]
+
+
+def decode_swap(payload: dict) -> list[SwapData]:
+    return [SwapData.from_dict(d) for d in _data(payload)]
+
+
+def decode_tokens(payload: dict) -> list[TokenInfo]:
+    return [TokenInfo.from_dict(d) for d in _data(payload)]
+
+
+def decode_liquidity(payload: dict) -> list[LiquiditySource]:
+    return [LiquiditySource.from_dict(d) for d in _data(payload)]
+
+
+def decode_supported_chain(payload: dict) -> list[ChainInfo]:
+    return [ChainInfo.from_dict(d) for d in _data(payload)]
+
+
+_CODE_RE = re.compile(r'"code"\s*:\s*"?(\w+)"?')
+_WS_RE = re.compile(r"\s*")
+_decoder = json.JSONDecoder()
+
+
+def _check_envelope(text: str, key: str) -> None:
+    # the document without the streamed items, a non-zero code raises like _data does
+    try:
+        payload = json_loads(text)
+    except ValueError:
+        raise ValueError("no JSON array '{}' in the response".format(key)) from None
+    if not isinstance(payload, dict):
+        raise ValueError("no JSON array '{}' in the response".format(key))
+    if str(payload.get("code")) != "0":
+        raise ApiError(payload.get("code"), payload.get("msg"))
+
+
+def _is_number(item: Any) -> bool:
+    return isinstance(item, (int, float)) and not isinstance(item, bool)
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes], key: str = "data") -> AsyncIterator[Any]:
+    # yields the items of the top-level array `key` while the document is still arriving,
+    # only the current item and the unread chunk tail are held in memory. The rest of the envelope
+    # is read once the array closes, a non-zero code raises ApiError there
+    start_re = re.compile(r'"{}"\s*:\s*\['.format(re.escape(key)))
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    # envelope text before the array, "key": [] included
+    head = ""
+    in_array = False
+    # an item is due next: right after "[" (where "]" may close an empty array) and after every ","
+    want_item = True
+    count = 0
+    done = False
+    eof = False
+    chunk_iter = chunks.__aiter__()
+
+    try:
+        while not done:
+            try:
+                chunk = await chunk_iter.__anext__()
+                buf = buf[pos:] + utf8.decode(chunk)
+            except StopAsyncIteration:
+                buf = buf[pos:] + utf8.decode(b"", final=True)
+                eof = True
+            pos = 0
+
+            if not in_array:
+                match = start_re.search(buf)
+                if match is None:
+                    if eof:
+                        # an error envelope, a proxy error page or a document without the array
+                        _check_envelope(buf, key)
+                        raise ValueError("no JSON array '{}' in the response".format(key))
+                    continue
+                code = _CODE_RE.search(buf, 0, match.start())
+                if code is not None and code.group(1) != "0":
+                    # error answers carry no items, the whole body is read for the message
+                    async for chunk in chunk_iter:
+                        buf += utf8.decode(chunk)
+                    _check_envelope(buf + utf8.decode(b"", final=True), key)
+                    raise ValueError("malformed JSON array '{}'".format(key))
+                head = buf[:match.end()] + "]"
+                in_array = True
+                pos = match.end()
+
+            while True:
+                pos = _WS_RE.match(buf, pos).end()
+                if pos >= len(buf):
+                    break
+                if not want_item:
+                    # exactly one "," between items
+                    if buf[pos] == "]":
+                        done = True
+                        pos += 1
+                        break
+                    if buf[pos] != ",":
+                        raise ValueError("malformed JSON array '{}'".format(key))
+                    pos += 1
+                    want_item = True
+                    continue
+                if buf[pos] == "]" and count == 0:
+                    done = True
+                    pos += 1
+                    break
+                if buf[pos] in ",]":
+                    # "[,1]", "[1,,2]" or "[1,]"
+                    raise ValueError("malformed JSON array '{}'".format(key))
+                try:
+                    item, end = _decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    # item not complete yet
+                    if eof:
+                        raise
+                    break
+                # only an item followed by a separator is complete, "1." then "5e3" must not yield 1
+                after = _WS_RE.match(buf, end).end()
+                if after >= len(buf) or buf[after] not in ",]":
+                    if eof or (after < len(buf) and not _is_number(item)):
+                        raise ValueError("malformed JSON array '{}'".format(key))
+                    break
+                pos = end
+                want_item = False
+                count += 1
+                yield item
+
+            if eof and not done:
+                raise ValueError("truncated JSON array '{}'".format(key))
+
+        # the envelope after the array, small next to the items
+        tail = buf[pos:]
+        async for chunk in chunk_iter:
+            tail += utf8.decode(chunk)
+        _check_envelope(head + tail + utf8.decode(b"", final=True), key)
+    finally:
+        # stop the download when the consumer stops early
+        if hasattr(chunk_iter, "aclose"):
+            await chunk_iter.aclose()
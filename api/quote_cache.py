@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from _decimal import Decimal
+
+from api import OKXDexClient, SwapMode
+
+QuoteKey = tuple[int, str, int, str, str, str]
+
+
+class QuoteCache:
+    # identical in-flight quotes share one upstream call, results live for ttl_ms in a bounded LRU
+    def __init__(self, client: OKXDexClient, ttl_ms: int = 300, max_size: int = 1024):
+        self.client = client
+        self.ttl_ms = ttl_ms
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._entries: OrderedDict[QuoteKey, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[QuoteKey, asyncio.Task] = {}
+
+    @staticmethod
+    def make_key(chain_idx: int, swap_mode: SwapMode, amount: int,
+                 from_token_contract_addr: str, to_token_contract_addr: str, slippage: Decimal) -> QuoteKey:
+        return (chain_idx, swap_mode.value, int(amount),
+                from_token_contract_addr.lower(), to_token_contract_addr.lower(), str(slippage))
+
+    async def get_aggregator_quote(self, chain_idx: int, swap_mode: SwapMode, amount: int,
+                                   from_token_contract_addr: str, to_token_contract_addr: str, slippage: Decimal,
+                                   timeout: Optional[int] = None) -> dict:
+        key = self.make_key(chain_idx, swap_mode, amount, from_token_contract_addr, to_token_contract_addr,
+                            slippage)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            del self._entries[key]
+            self.expirations += 1
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch(key, chain_idx, swap_mode, amount,
+                                                     from_token_contract_addr, to_token_contract_addr, slippage,
+                                                     timeout))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # a cancelled waiter must not cancel the call other waiters share
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: QuoteKey, chain_idx: int, swap_mode: SwapMode, amount: int,
+                     from_token_contract_addr: str, to_token_contract_addr: str, slippage: Decimal,
+                     timeout: Optional[int]) -> dict:
+        payload = await self.client.get_aggregator_quote(chain_idx, swap_mode, amount,
+                                                         from_token_contract_addr, to_token_contract_addr,
+                                                         slippage, timeout)
+        if payload.get("code") == "0" and self.ttl_ms > 0:
+            self._entries[key] = (time.monotonic() + self.ttl_ms / 1000, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return payload
+
+    async def get_aggregator_swap(self, chain_idx: int, swap_mode: SwapMode, amount: int,
+                                  from_token_contract_addr: str, to_token_contract_addr: str,
+                                  user_addr: str, slippage: Decimal,
+                                  timeout: Optional[int] = None) -> dict:
+        # swap calldata must always be fresh, never cached or merged
+        return await self.client.get_aggregator_swap(chain_idx, swap_mode, amount,
+                                                     from_token_contract_addr, to_token_contract_addr,
+                                                     user_addr, slippage, timeout)
+
+    def invalidate(self, chain_idx: int, swap_mode: SwapMode, amount: int,
+                   from_token_contract_addr: str, to_token_contract_addr: str, slippage: Decimal) -> None:
+        key = self.make_key(chain_idx, swap_mode, amount, from_token_contract_addr, to_token_contract_addr,
+                            slippage)
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
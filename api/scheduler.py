@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import heapq
+import random
+import time
+from enum import IntEnum
+from typing import Optional, Callable, Awaitable, Mapping
+
+
+class Priority(IntEnum):
+    SWAP = 0
+    QUOTE = 1
+    GAS_LIMIT = 2
+    METADATA = 3
+
+
+# request path => (token bucket group, priority class)
+ENDPOINT_GROUPS: dict[str, tuple[str, Priority]] = {
+    "/api/v5/dex/aggregator/swap": ("swap", Priority.SWAP),
+    "/api/v5/dex/aggregator/approve-transaction": ("swap", Priority.SWAP),
+    "/api/v5/dex/aggregator/quote": ("quote", Priority.QUOTE),
+    "/api/v5/dex/pre-transaction/gas-limit": ("gas-limit", Priority.GAS_LIMIT),
+    "/api/v5/dex/aggregator/supported/chain": ("metadata", Priority.METADATA),
+    "/api/v5/dex/aggregator/all-tokens": ("metadata", Priority.METADATA),
+    "/api/v5/dex/aggregator/get-liquidity": ("metadata", Priority.METADATA),
+    "/api/v5/dex/aggregator/history": ("metadata", Priority.METADATA),
+}
+
+# group => (requests per second, burst)
+DEFAULT_RATES: dict[str, tuple[float, float]] = {
+    "swap": (10, 10),
+    "quote": (10, 10),
+    "gas-limit": (5, 5),
+    "metadata": (2, 4),
+}
+
+# OKX error codes: 50011 too many requests, 50061 sub-account rate limit, 50013 system busy
+RATE_LIMIT_CODES = {"50011", "50061"}
+BUSY_CODES = {"50013"}
+
+SendResult = tuple[int, Mapping[str, str], dict]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        # seconds until one token is available, 0 when it is available now
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class GroupStats:
+    def __init__(self):
+        self.dispatched = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.retries = 0
+        self.rate_limited = 0
+
+
+class RequestScheduler:
+    # token bucket per endpoint group, dispatch by priority class, backoff on rate-limit answers
+    def __init__(self, rates: Optional[dict[str, tuple[float, float]]] = None, max_concurrency: int = 32,
+                 max_retries: int = 3, base_backoff: float = 0.25, max_backoff: float = 8.0,
+                 endpoint_groups: Optional[dict[str, tuple[str, Priority]]] = None):
+        self.rates = dict(DEFAULT_RATES if rates is None else rates)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.endpoint_groups = ENDPOINT_GROUPS if endpoint_groups is None else endpoint_groups
+
+        self._buckets = {group: TokenBucket(rate, burst) for group, (rate, burst) in self.rates.items()}
+        self._queues: dict[str, list] = {group: [] for group in self._buckets}
+        self._stats = {group: GroupStats() for group in self._buckets}
+        self._in_flight = 0
+        self._seq = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def classify(self, request_path: str) -> tuple[str, Priority]:
+        path = request_path.split("?", 1)[0]
+        group, priority = self.endpoint_groups.get(path, ("metadata", Priority.METADATA))
+        if group not in self._buckets:
+            rate, burst = self.rates.get(group, DEFAULT_RATES["metadata"])
+            self._buckets[group] = TokenBucket(rate, burst)
+            self._queues[group] = []
+            self._stats[group] = GroupStats()
+        return group, priority
+
+    def _ensure_dispatcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._in_flight = 0
+            for queue in self._queues.values():
+                queue.clear()
+            self._task = loop.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._wakeup.clear()
+            wait: Optional[float] = None
+            while self._in_flight < self.max_concurrency:
+                now = time.monotonic()
+                best_group = None
+                best_head = None
+                for group, queue in self._queues.items():
+                    while queue and queue[0][3].done():
+                        # waiter was cancelled while queued
+                        heapq.heappop(queue)
+                    if not queue:
+                        continue
+                    delay = self._buckets[group].delay(now)
+                    if delay > 0:
+                        wait = delay if wait is None else min(wait, delay)
+                        continue
+                    if best_head is None or queue[0][:2] < best_head[:2]:
+                        best_group, best_head = group, queue[0]
+                if best_group is None:
+                    break
+                heapq.heappop(self._queues[best_group])
+                self._buckets[best_group].take()
+                self._in_flight += 1
+                stats = self._stats[best_group]
+                waited = now - best_head[2]
+                stats.dispatched += 1
+                stats.wait_total += waited
+                stats.wait_max = max(stats.wait_max, waited)
+                best_head[3].set_result(None)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _acquire(self, group: str, priority: Priority) -> None:
+        self._ensure_dispatcher()
+        fut = self._loop.create_future()
+        self._seq += 1
+        heapq.heappush(self._queues[group], (int(priority), self._seq, time.monotonic(), fut))
+        self._wakeup.set()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._wakeup.set()
+
+    def _retry_delay(self, group: str, result: SendResult, attempt: int) -> Optional[float]:
+        status, headers, payload = result
+        code = str(payload.get("code")) if isinstance(payload, dict) else None
+        if status == 429 or code in RATE_LIMIT_CODES:
+            self._stats[group].rate_limited += 1
+            retry_after = headers.get("Retry-After")
+            if retry_after is not None:
+                try:
+                    return min(self.max_backoff, float(retry_after))
+                except ValueError:
+                    pass
+        elif not (status >= 500 or code in BUSY_CODES):
+            return None
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        return backoff + random.uniform(0, self.base_backoff)
+
+    async def submit(self, request_path: str, send: Callable[[], Awaitable[SendResult]],
+                     on_retry: Optional[Callable[[int, float], None]] = None) -> dict:
+        group, priority = self.classify(request_path)
+        attempt = 0
+        while True:
+            await self._acquire(group, priority)
+            try:
+                result = await send()
+            finally:
+                self._release()
+            delay = self._retry_delay(group, result, attempt)
+            if delay is None or attempt >= self.max_retries:
+                return result[2]
+            attempt += 1
+            self._stats[group].retries += 1
+            if on_retry is not None:
+                on_retry(attempt, delay)
+            # back the whole group off, the retry queues again behind the pause
+            self._buckets[group].pause(delay)
+
+    def queue_depth(self, group: Optional[str] = None) -> int:
+        if group is not None:
+            return sum(1 for entry in self._queues.get(group, []) if not entry[3].done())
+        return sum(self.queue_depth(g) for g in self._queues)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "groups": {
+                group: {
+                    "queue_depth": self.queue_depth(group),
+                    "dispatched": stats.dispatched,
+                    "wait_avg": stats.wait_total / stats.dispatched if stats.dispatched else 0.0,
+                    "wait_max": stats.wait_max,
+                    "retries": stats.retries,
+                    "rate_limited": stats.rate_limited,
+                    "tokens": self._buckets[group].tokens,
+                }
+                for group, stats in self._stats.items()
+            },
+        }
+
+    async def close(self) -> None:
+        if self._task is not None and self._loop is asyncio.get_running_loop():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional, Callable, Awaitable, Union, Iterable
+
+from api import OKXDexClient
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResource:
+    # one cached API payload per chain, with TTL, on-disk snapshot and stale-while-revalidate
+    def __init__(self, name: str, fetch: Callable[[int], Awaitable[dict]],
+                 ttl: Union[float, dict[int, float]], snapshot_dir: Optional[str] = None,
+                 on_update: Optional[Callable[[int, dict], None]] = None):
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.snapshot_dir = snapshot_dir
+        self.on_update = on_update
+
+        self._entries: dict[int, tuple[float, dict]] = {}
+        self._refreshing: dict[int, asyncio.Task] = {}
+
+    def get_ttl(self, chain_idx: int) -> float:
+        if isinstance(self.ttl, dict):
+            return self.ttl.get(chain_idx, self.ttl.get(0, 3600))
+        return self.ttl
+
+    def age(self, chain_idx: int) -> Optional[float]:
+        entry = self._entries.get(chain_idx)
+        return time.time() - entry[0] if entry is not None else None
+
+    def peek(self, chain_idx: int) -> Optional[dict]:
+        entry = self._entries.get(chain_idx)
+        return entry[1] if entry is not None else None
+
+    def _snapshot_path(self, chain_idx: int) -> Optional[str]:
+        if self.snapshot_dir is None:
+            return None
+        return os.path.join(self.snapshot_dir, "{}_{}.json".format(self.name, chain_idx))
+
+    def _read_snapshot(self, chain_idx: int) -> Optional[tuple[float, dict]]:
+        path = self._snapshot_path(chain_idx)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                snapshot = json.load(f)
+            return float(snapshot["fetched_at"]), snapshot["payload"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_snapshot(self, chain_idx: int, fetched_at: float, payload: dict) -> None:
+        path = self._snapshot_path(chain_idx)
+        if path is None:
+            return
+        # the snapshot is only a warm start for the next process, a full disk must not fail the fetch
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"fetched_at": fetched_at, "payload": payload}, f)
+            os.replace(tmp_path, path)
+        except OSError as ex:
+            logger.warning("%s snapshot for chain %s not written: %s", self.name, chain_idx, ex)
+
+    def _set(self, chain_idx: int, fetched_at: float, payload: dict) -> None:
+        self._entries[chain_idx] = (fetched_at, payload)
+        if self.on_update is not None:
+            self.on_update(chain_idx, payload)
+
+    async def refresh(self, chain_idx: int) -> dict:
+        # concurrent callers share one in-flight fetch per chain
+        task = self._refreshing.get(chain_idx)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(chain_idx))
+            self._refreshing[chain_idx] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(chain_idx, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, chain_idx: int) -> dict:
+        payload = await self.fetch(chain_idx)
+        if payload.get("code") != "0":
+            # keep serving the last good payload on API errors
+            entry = self._entries.get(chain_idx)
+            return entry[1] if entry is not None else payload
+        fetched_at = time.time()
+        self._set(chain_idx, fetched_at, payload)
+        await asyncio.to_thread(self._write_snapshot, chain_idx, fetched_at, payload)
+        return payload
+
+    async def get(self, chain_idx: int) -> dict:
+        entry = self._entries.get(chain_idx)
+        if entry is None:
+            entry = await asyncio.to_thread(self._read_snapshot, chain_idx)
+            if entry is not None and chain_idx not in self._entries:
+                self._set(chain_idx, *entry)
+        if entry is None:
+            return await self.refresh(chain_idx)
+        if time.time() - entry[0] >= self.get_ttl(chain_idx) and chain_idx not in self._refreshing:
+            # serve the stale payload, refresh in background
+            task = asyncio.ensure_future(self.refresh(chain_idx))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return entry[1]
+
+
+class TokenRegistry:
+    def __init__(self, client: OKXDexClient, ttl: Union[float, dict[int, float]] = 3600,
+                 liquidity_ttl: Union[float, dict[int, float]] = 3600,
+                 supported_chain_ttl: Union[float, dict[int, float]] = 86400,
+                 snapshot_dir: Optional[str] = None):
+        self.client = client
+        self.tokens = CachedResource("all_tokens", client.get_aggregator_all_tokens, ttl,
+                                     snapshot_dir, self._index_tokens)
+        self.liquidity = CachedResource("liquidity", client.get_aggregator_liquidity, liquidity_ttl,
+                                        snapshot_dir)
+        self.supported_chain = CachedResource("supported_chain", client.get_aggregator_supported_chain,
+                                              supported_chain_ttl, snapshot_dir)
+
+        self._by_address: dict[int, dict[str, dict]] = {}
+        self._by_symbol: dict[int, dict[str, list[dict]]] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _index_tokens(self, chain_idx: int, payload: dict) -> None:
+        by_address: dict[str, dict] = {}
+        by_symbol: dict[str, list[dict]] = {}
+        for token in payload.get("data") or []:
+            addr = token.get("tokenContractAddress")
+            if addr:
+                by_address[addr.lower()] = token
+            symbol = token.get("tokenSymbol")
+            if symbol:
+                by_symbol.setdefault(symbol.upper(), []).append(token)
+        self._by_address[chain_idx] = by_address
+        self._by_symbol[chain_idx] = by_symbol
+
+    async def load(self, chain_idx: int) -> None:
+        await self.tokens.get(chain_idx)
+
+    # lookups from memory, call load() first
+    def token_by_address(self, chain_idx: int, token_contract_addr: str) -> Optional[dict]:
+        return self._by_address.get(chain_idx, {}).get(token_contract_addr.lower())
+
+    def tokens_by_symbol(self, chain_idx: int, symbol: str) -> list[dict]:
+        return self._by_symbol.get(chain_idx, {}).get(symbol.upper(), [])
+
+    async def get_token(self, chain_idx: int, token_contract_addr: str) -> Optional[dict]:
+        await self.tokens.get(chain_idx)
+        return self.token_by_address(chain_idx, token_contract_addr)
+
+    async def get_tokens_by_symbol(self, chain_idx: int, symbol: str) -> list[dict]:
+        await self.tokens.get(chain_idx)
+        return self.tokens_by_symbol(chain_idx, symbol)
+
+    async def get_decimals(self, chain_idx: int, token_contract_addr: str) -> Optional[int]:
+        token = await self.get_token(chain_idx, token_contract_addr)
+        if token is None or token.get("decimals") in (None, ""):
+            return None
+        return int(token["decimals"])
+
+    async def get_aggregator_all_tokens(self, chain_idx: int) -> dict:
+        return await self.tokens.get(chain_idx)
+
+    async def get_aggregator_liquidity(self, chain_idx: int) -> dict:
+        return await self.liquidity.get(chain_idx)
+
+    async def get_aggregator_supported_chain(self, chain_idx: int) -> dict:
+        return await self.supported_chain.get(chain_idx)
+
+    def start(self, chain_idxs: Iterable[int], interval: float = 60) -> None:
+        # background refresh of every resource once it gets older than its TTL
+        chain_idxs = list(chain_idxs)
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop(chain_idxs, interval))
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self, chain_idxs: list[int], interval: float) -> None:
+        while True:
+            for resource in (self.tokens, self.liquidity, self.supported_chain):
+                for chain_idx in chain_idxs:
+                    try:
+                        age = resource.age(chain_idx)
+                        if age is None:
+                            # first round picks up the on-disk snapshot before deciding to fetch
+                            await resource.get(chain_idx)
+                            age = resource.age(chain_idx)
+                        if age is None or age >= resource.get_ttl(chain_idx):
+                            await resource.refresh(chain_idx)
+                    except Exception:
+                        # keep refreshing the other resources, this one is retried next round
+                        pass
+            await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    async def func(api_key: str, secret_key: str, pass_phrase: str):
+        async with OKXDexClient(api_key, secret_key, pass_phrase, timeout=10) as client:
+            registry = TokenRegistry(client, snapshot_dir="../.cache")
+            print(await registry.get_decimals(1, "0xA0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"))
+            print(await registry.get_tokens_by_symbol(1, "usdt"))
+            print(await registry.get_aggregator_supported_chain(1))
+
+
+    load_dotenv("../.env")
+    apikey = str(os.getenv("API_KEY"))
+    secretkey = str(os.getenv("API_SECRET"))
+    passphrase = str(os.getenv("API_PASSPHRASE"))
+
+    asyncio.run(func(apikey, secretkey, passphrase))
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import sys
+import time
+import tracemalloc
+from typing import Optional, Any, Awaitable, Callable, NamedTuple
+
+from _decimal import Decimal
+
+import rpc
+from api import OKXDexClient, SwapMode, QuoteSpec
+from benchmarks.mock_server import MockConfig, MOCK_SPENDER_ADDR, serve_forever, add_mock_arguments, \
+    config_from_args
+
+CHAIN_IDX = 56
+FROM_TOKEN_ADDR = "0x55d398326f99059ff775485246999027b3197955"
+TO_TOKEN_ADDR = "0x8ac76a51cc950d9822d68b83fe1ad97b32cd580d"
+AMOUNT = 10 ** 18
+SLIPPAGE = Decimal("0.005")
+# throwaway key, the mock node accepts any signed transaction
+PRIVATE_KEY = bytes.fromhex("4c0883a69102937d6231471b5dbb6204fe5129617082792ae468d01a3f362318")
+
+
+class ScenarioResult(NamedTuple):
+    name: str
+    requests: int
+    errors: int
+    elapsed: float
+    # operations per second
+    throughput: float
+    p50_ms: float
+    p99_ms: float
+    # tracemalloc peak of a second, traced run; None when memory tracing is off
+    peak_kb: Optional[float]
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+
+def percentile(samples: list[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+
+def _quote_ok(payload: Any) -> bool:
+    return isinstance(payload, dict) and payload.get("code") == "0"
+
+
+class Bench:
+    # one client and node url shared by every scenario, like a long running service would
+    def __init__(self, okx_url: str, node_url: str, requests: int = 200, concurrency: int = 32):
+        self.okx_url = okx_url
+        self.node_url = node_url
+        self.requests = requests
+        self.concurrency = concurrency
+        self.client = OKXDexClient("api-key", "secret-key", "pass-phrase", domain_name=okx_url)
+
+    async def _timed(self, op: Callable[[], Awaitable[Any]], is_ok: Callable[[Any], bool],
+                     latencies: list[float]) -> bool:
+        start = time.perf_counter()
+        try:
+            ok = is_ok(await op())
+        except Exception:
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        return ok
+
+    async def _sequential(self, op: Callable[[], Awaitable[Any]], is_ok: Callable[[Any], bool],
+                          latencies: list[float]) -> int:
+        errors = 0
+        for _ in range(self.requests):
+            if not await self._timed(op, is_ok, latencies):
+                errors += 1
+        return errors
+
+    async def _fan_out(self, op: Callable[[], Awaitable[Any]], is_ok: Callable[[Any], bool],
+                       latencies: list[float]) -> int:
+        # gathers of `concurrency` calls, one after the other
+        errors = 0
+        for i in range(0, self.requests, self.concurrency):
+            n = min(self.concurrency, self.requests - i)
+            results = await asyncio.gather(*[self._timed(op, is_ok, latencies) for _ in range(n)])
+            errors += results.count(False)
+        return errors
+
+    def _quote(self) -> Awaitable[dict]:
+        return self.client.get_aggregator_quote(CHAIN_IDX, SwapMode.exactIn, AMOUNT, FROM_TOKEN_ADDR,
+                                                TO_TOKEN_ADDR, SLIPPAGE)
+
+    def _nonce(self) -> Awaitable[Optional[int]]:
+        return rpc.check_nonce(self.node_url, MOCK_SPENDER_ADDR)
+
+    async def quote_single(self, latencies: list[float]) -> int:
+        return await self._sequential(self._quote, _quote_ok, latencies)
+
+    async def quote_gather(self, latencies: list[float]) -> int:
+        return await self._fan_out(self._quote, _quote_ok, latencies)
+
+    async def quote_many(self, latencies: list[float]) -> int:
+        # streaming window of `concurrency` quotes instead of gather batches
+        async def fetch(*args, **kwargs) -> dict:
+            start = time.perf_counter()
+            try:
+                return await self.client.get_aggregator_quote(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        spec = QuoteSpec(CHAIN_IDX, SwapMode.exactIn, AMOUNT, FROM_TOKEN_ADDR, TO_TOKEN_ADDR, SLIPPAGE)
+        errors = 0
+        async for outcome in self.client.quote_many([spec] * self.requests, self.concurrency, fetch=fetch):
+            if outcome.error is not None or not _quote_ok(outcome.result):
+                errors += 1
+        return errors
+
+    async def rpc_single(self, latencies: list[float]) -> int:
+        return await self._sequential(self._nonce, lambda res: res is not None, latencies)
+
+    async def rpc_gather(self, latencies: list[float]) -> int:
+        return await self._fan_out(self._nonce, lambda res: res is not None, latencies)
+
+    async def swap_flow(self, latencies: list[float]) -> int:
+        # allowance, nonce, gas price and swap in parallel, then sign and broadcast
+        from eth_account import Account
+        from swap import execute_swap
+
+        user_addr = Account.from_key(PRIVATE_KEY).address
+
+        def op() -> Awaitable[Any]:
+            return execute_swap(self.client, self.node_url, CHAIN_IDX, SwapMode.exactIn, AMOUNT, FROM_TOKEN_ADDR,
+                                TO_TOKEN_ADDR, user_addr, MOCK_SPENDER_ADDR, SLIPPAGE, PRIVATE_KEY)
+
+        return await self._fan_out(op, lambda res: res is not None, latencies)
+
+    def scenarios(self) -> dict[str, Callable[[list[float]], Awaitable[int]]]:
+        return {
+            "quote_single": self.quote_single,
+            "quote_gather": self.quote_gather,
+            "quote_many": self.quote_many,
+            "rpc_single": self.rpc_single,
+            "rpc_gather": self.rpc_gather,
+            "swap_flow": self.swap_flow,
+        }
+
+    async def run(self, name: str, trace_memory: bool = True) -> ScenarioResult:
+        scenario = self.scenarios()[name]
+        # untimed warm-up: connections, imports, the web3 chain id cache
+        self.requests, requests = min(self.requests, self.concurrency), self.requests
+        try:
+            await scenario([])
+        finally:
+            self.requests = requests
+
+        latencies: list[float] = []
+        start = time.perf_counter()
+        errors = await scenario(latencies)
+        elapsed = time.perf_counter() - start
+
+        peak_kb = None
+        if trace_memory:
+            # tracing slows python down, memory gets a run of its own so the timings stay clean
+            tracemalloc.start()
+            try:
+                await scenario([])
+                peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+            finally:
+                tracemalloc.stop()
+
+        return ScenarioResult(name, self.requests, errors, elapsed, self.requests / elapsed if elapsed else 0.0,
+                              percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, peak_kb)
+
+    async def close(self) -> None:
+        await self.client.close()
+        await rpc.close_nodes()
+
+
+def start_mock(config: MockConfig) -> tuple[multiprocessing.Process, dict]:
+    # the stand-ins run in their own process so they do not share the event loop being measured
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve_forever, args=(config, "127.0.0.1", 0, 0, child_conn),
+                                      daemon=True)
+    process.start()
+    if not parent_conn.poll(30):
+        process.terminate()
+        raise RuntimeError("mock servers did not start")
+    return process, parent_conn.recv()
+
+
+def check_thresholds(results: list[ScenarioResult], thresholds: dict[str, dict]) -> list[str]:
+    # {"scenario": {"min_throughput": .., "max_p50_ms": .., "max_p99_ms": .., "max_peak_kb": ..,
+    #  "max_error_rate": ..}}, every key optional
+    failures = []
+    for res in results:
+        limits = thresholds.get(res.name, {})
+        checks = [
+            ("min_throughput", res.throughput, lambda value, limit: value >= limit),
+            ("max_p50_ms", res.p50_ms, lambda value, limit: value <= limit),
+            ("max_p99_ms", res.p99_ms, lambda value, limit: value <= limit),
+            ("max_peak_kb", res.peak_kb, lambda value, limit: value <= limit),
+            ("max_error_rate", res.error_rate, lambda value, limit: value <= limit),
+        ]
+        for key, value, passes in checks:
+            limit = limits.get(key)
+            if limit is not None and value is not None and not passes(value, limit):
+                failures.append("{} {} {:.2f} (limit {})".format(res.name, key, value, limit))
+    return failures
+
+
+def format_table(results: list[ScenarioResult]) -> str:
+    lines = ["{:<14}{:>8}{:>8}{:>12}{:>10}{:>10}{:>12}".format("scenario", "ops", "errors", "ops/s", "p50 ms",
+                                                               "p99 ms", "peak KiB")]
+    for res in results:
+        lines.append("{:<14}{:>8}{:>8}{:>12.1f}{:>10.2f}{:>10.2f}{:>12}".format(
+            res.name, res.requests, res.errors, res.throughput, res.p50_ms, res.p99_ms,
+            "-" if res.peak_kb is None else "{:.0f}".format(res.peak_kb)))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="throughput, p50/p99 latency and peak memory against local mock OKX DEX / JSON-RPC servers")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="operations per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="fan-out width")
+    parser.add_argument("-s", "--scenario", action="append", default=None,
+                        help="scenario to run, repeatable, all by default")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced memory run")
+    parser.add_argument("--thresholds", default=None,
+                        help="json file with per scenario limits, exits 1 when one is exceeded")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    process, urls = start_mock(config_from_args(args))
+
+    async def run() -> list[ScenarioResult]:
+        bench = Bench(urls["okx"], urls["node"], args.requests, args.concurrency)
+        try:
+            names = args.scenario or list(bench.scenarios())
+            return [await bench.run(name, not args.no_memory) for name in names]
+        finally:
+            await bench.close()
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        process.terminate()
+        process.join()
+
+    if args.json:
+        print(json.dumps([dict(res._asdict(), error_rate=res.error_rate) for res in results], indent=2))
+    else:
+        print(format_table(results))
+
+    if args.thresholds is None:
+        return 0
+    with open(args.thresholds, encoding="utf-8") as f:
+        failures = check_thresholds(results, json.load(f))
+    for failure in failures:
+        print("threshold exceeded: " + failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
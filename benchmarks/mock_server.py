@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from multiprocessing.connection import Connection
+from typing import Optional, Any, Callable
+
+from aiohttp import web
+
+MOCK_ROUTER_ADDR = "0x3b3ae790df4f312e745d270119c6052904fb6790"
+MOCK_SPENDER_ADDR = "0x40aa958dd87fc8305b97f2ba922cddca374bcd7f"
+MULTICALL3_ADDR = "0xca11bde05977b3631167028862be2a173976ca11"
+MAX_UINT256 = 2 ** 256 - 1
+
+
+class MockConfig:
+    # latency in seconds, rates as fractions of requests, payload_size as list entries / calldata bytes
+    def __init__(self, latency: float = 0.02, jitter: float = 0.005, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, payload_size: int = 4, allowance: int = MAX_UINT256,
+                 seed: Optional[int] = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.payload_size = payload_size
+        self.allowance = allowance
+        self.random = random.Random(seed)
+
+    async def delay(self) -> None:
+        delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def fault(self) -> Optional[str]:
+        # None, "error" or "rate_limit"
+        r = self.random.random()
+        if r < self.rate_limit_rate:
+            return "rate_limit"
+        if r < self.rate_limit_rate + self.error_rate:
+            return "error"
+        return None
+
+
+def _ok(data: Any) -> web.Response:
+    return web.json_response({"code": "0", "data": data, "msg": ""})
+
+
+class MockOkxServer:
+    # stand-in for the /api/v5/dex/aggregator/* and /pre-transaction/gas-limit endpoints, requests are not
+    # authenticated, answers have the shape of the real ones with payload_size dex routes / tokens / bytes
+    def __init__(self, config: Optional[MockConfig] = None):
+        self.config = config or MockConfig()
+        self.requests = 0
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._faults])
+        app.router.add_get("/api/v5/dex/aggregator/supported/chain", self.supported_chain)
+        app.router.add_get("/api/v5/dex/aggregator/all-tokens", self.all_tokens)
+        app.router.add_get("/api/v5/dex/aggregator/get-liquidity", self.liquidity)
+        app.router.add_get("/api/v5/dex/aggregator/approve-transaction", self.approve_transaction)
+        app.router.add_get("/api/v5/dex/aggregator/quote", self.quote)
+        app.router.add_get("/api/v5/dex/aggregator/swap", self.swap)
+        app.router.add_get("/api/v5/dex/aggregator/history", self.history)
+        app.router.add_post("/api/v5/dex/pre-transaction/gas-limit", self.gas_limit)
+        return app
+
+    @web.middleware
+    async def _faults(self, request: web.Request, handler) -> web.StreamResponse:
+        self.requests += 1
+        await self.config.delay()
+        fault = self.config.fault()
+        if fault == "rate_limit":
+            return web.json_response({"code": "50011", "data": [], "msg": "Too Many Requests"}, status=429,
+                                     headers={"Retry-After": "1"})
+        if fault == "error":
+            return web.json_response({"code": "50001", "data": [], "msg": "Service temporarily unavailable"},
+                                     status=500)
+        return await handler(request)
+
+    def _router_result(self, query) -> dict:
+        amount = int(query.get("amount", "0"))
+        size = self.config.payload_size
+        return {
+            "chainIndex": query.get("chainIndex"),
+            "swapMode": query.get("swapMode", "exactIn"),
+            "fromTokenAmount": str(amount),
+            "toTokenAmount": str(amount * 3 // 2),
+            "tradeFee": "0.12",
+            "estimateGasFee": "135000",
+            "priceImpactPercentage": "-0.05",
+            "fromToken": {"tokenContractAddress": query.get("fromTokenAddress"), "tokenSymbol": "FROM",
+                          "decimal": "18", "tokenUnitPrice": "1.0"},
+            "toToken": {"tokenContractAddress": query.get("toTokenAddress"), "tokenSymbol": "TO",
+                        "decimal": "6", "tokenUnitPrice": "1.0"},
+            "dexRouterList": [
+                {"router": "{}--{}".format(query.get("fromTokenAddress"), query.get("toTokenAddress")),
+                 "routerPercent": str(100 // size if size else 100),
+                 "subRouterList": [{"dexProtocol": [{"dexName": "Mock V{}".format(i), "percent": "100"}]}]}
+                for i in range(size)
+            ],
+        }
+
+    async def supported_chain(self, request: web.Request) -> web.Response:
+        return _ok([{"chainIndex": request.query.get("chainIndex"), "chainName": "Mock",
+                     "dexTokenApproveAddress": MOCK_SPENDER_ADDR}])
+
+    async def all_tokens(self, request: web.Request) -> web.Response:
+        return _ok([{"tokenContractAddress": "0x{:040x}".format(i + 1), "tokenSymbol": "T{}".format(i),
+                     "tokenName": "Token {}".format(i), "decimals": "18", "tokenLogoUrl": ""}
+                    for i in range(self.config.payload_size)])
+
+    async def liquidity(self, request: web.Request) -> web.Response:
+        return _ok([{"id": str(i), "name": "Mock V{}".format(i), "logo": ""}
+                    for i in range(self.config.payload_size)])
+
+    async def approve_transaction(self, request: web.Request) -> web.Response:
+        approve_amount = int(request.query.get("approveAmount", "0"))
+        data = "0x095ea7b3" + MOCK_SPENDER_ADDR[2:].rjust(64, "0") + "{:064x}".format(approve_amount)
+        return _ok([{"data": data, "dexContractAddress": MOCK_SPENDER_ADDR, "gasLimit": "50000",
+                     "gasPrice": "1000000000"}])
+
+    async def quote(self, request: web.Request) -> web.Response:
+        return _ok([self._router_result(request.query)])
+
+    async def swap(self, request: web.Request) -> web.Response:
+        query = request.query
+        native = query.get("fromTokenAddress", "").lower() == "0xeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee"
+        return _ok([{
+            "routerResult": self._router_result(query),
+            "tx": {
+                "from": query.get("userWalletAddress"),
+                "to": MOCK_ROUTER_ADDR,
+                "value": query.get("amount", "0") if native else "0",
+                "gas": "200000",
+                "gasPrice": "1000000000",
+                "minReceiveAmount": query.get("amount", "0"),
+                "data": "0xb80c2f09" + "ab" * (32 * self.config.payload_size),
+            },
+        }])
+
+    async def history(self, request: web.Request) -> web.Response:
+        return _ok({"chainId": request.query.get("chainIndex"), "txHash": request.query.get("txHash"),
+                    "status": "success", "height": "1000", "txTime": "0"})
+
+    async def gas_limit(self, request: web.Request) -> web.Response:
+        await request.read()
+        return _ok([{"gasLimit": "21000"}])
+
+
+class MockNodeServer:
+    # stand-in JSON-RPC node: answers single requests and batches, Multicall3 aggregate3 included
+    def __init__(self, config: Optional[MockConfig] = None, chain_id: int = 56):
+        self.config = config or MockConfig()
+        self.chain_id = chain_id
+        self.requests = 0
+        self.calls = 0
+        self.block_number = 1000
+        self.nonces: dict[str, int] = {}
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        payload = await request.json()
+        await self.config.delay()
+        if self.config.fault() is not None:
+            return web.Response(status=503, text="mock node unavailable")
+        if isinstance(payload, list):
+            return web.json_response([self._answer(item) for item in payload])
+        return web.json_response(self._answer(payload))
+
+    def _answer(self, item: dict) -> dict:
+        self.calls += 1
+        try:
+            result = self._result(item["method"], item.get("params") or [])
+        except KeyError:
+            return {"jsonrpc": "2.0", "id": item.get("id"),
+                    "error": {"code": -32601, "message": "method not found"}}
+        return {"jsonrpc": "2.0", "id": item.get("id"), "result": result}
+
+    def _result(self, method: str, params: list) -> Any:
+        if method == "eth_chainId":
+            return hex(self.chain_id)
+        if method == "eth_blockNumber":
+            self.block_number += 1
+            return hex(self.block_number)
+        if method == "eth_gasPrice":
+            return hex(10 ** 9)
+        if method == "eth_estimateGas":
+            return hex(150000)
+        if method == "eth_getBalance":
+            return hex(10 ** 20)
+        if method == "eth_getTransactionCount":
+            return hex(self.nonces.get(params[0].lower(), 0))
+        if method == "eth_feeHistory":
+            count = int(params[0], 16) if isinstance(params[0], str) else int(params[0])
+            return {"oldestBlock": hex(self.block_number - count + 1),
+                    "baseFeePerGas": [hex(10 ** 9)] * (count + 1),
+                    "gasUsedRatio": [0.5] * count,
+                    "reward": [[hex(10 ** 8)] * len(params[2] if len(params) > 2 else [])] * count}
+        if method == "eth_call":
+            return self._call(params[0])
+        if method == "eth_sendRawTransaction":
+            return "0x" + hashlib.sha256(bytes.fromhex(params[0][2:])).hexdigest()
+        if method == "eth_getTransactionReceipt":
+            return {"transactionHash": params[0], "blockNumber": hex(self.block_number - 1), "status": "0x1",
+                    "logs": []}
+        if method == "eth_getLogs":
+            return []
+        raise KeyError(method)
+
+    def _call(self, tx: dict) -> str:
+        # erc20 allowance / balanceOf answer config.allowance, aggregate3 answers each inner call the same way
+        data = tx.get("data") or tx.get("input") or "0x"
+        if tx.get("to", "").lower() == MULTICALL3_ADDR and data.startswith("0x82ad56cb"):
+            from eth_abi import encode, decode
+            calls = decode(["(address,bool,bytes)[]"], bytes.fromhex(data[10:]))[0]
+            value = self.config.allowance.to_bytes(32, "big")
+            return "0x" + encode(["(bool,bytes)[]"], [[(True, value) for _ in calls]]).hex()
+        return "0x{:064x}".format(self.config.allowance)
+
+
+async def start_site(app: web.Application, host: str = "127.0.0.1", port: int = 0) -> tuple[web.AppRunner, str]:
+    # port 0 picks a free port, the base url is returned with the runner
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner, "http://{}:{}".format(host, runner.addresses[0][1])
+
+
+async def serve(config: MockConfig, host: str = "127.0.0.1", okx_port: int = 0, node_port: int = 0,
+                on_ready: Optional[Callable[[dict], None]] = None) -> None:
+    # runs both stand-ins until cancelled, on_ready gets their base urls
+    okx_runner, okx_url = await start_site(MockOkxServer(config).make_app(), host, okx_port)
+    node_runner, node_url = await start_site(MockNodeServer(config).make_app(), host, node_port)
+    try:
+        if on_ready is not None:
+            on_ready({"okx": okx_url, "node": node_url})
+        await asyncio.Event().wait()
+    finally:
+        await okx_runner.cleanup()
+        await node_runner.cleanup()
+
+
+def serve_forever(config: MockConfig, host: str = "127.0.0.1", okx_port: int = 0, node_port: int = 0,
+                  conn: Optional[Connection] = None) -> None:
+    # process target, the urls go to conn (a multiprocessing Pipe end) or to stdout
+    def on_ready(urls: dict) -> None:
+        if conn is not None:
+            conn.send(urls)
+        else:
+            print(json.dumps(urls), flush=True)
+
+    try:
+        asyncio.run(serve(config, host, okx_port, node_port, on_ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.005, help="+- seconds around the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered with a server error")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction answered with 429")
+    parser.add_argument("--payload-size", type=int, default=4, help="dex routes / tokens per answer")
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.payload_size)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="local mock OKX DEX API and JSON-RPC node")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--okx-port", type=int, default=8701)
+    parser.add_argument("--node-port", type=int, default=8702)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    serve_forever(config_from_args(args), args.host, args.okx_port, args.node_port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Optional, Any, Callable, Awaitable, IO, Iterator, TYPE_CHECKING
+
+# only the standard library is imported at load, aiohttp and the api / rpc packages come in with the first
+# operation that needs them so a short batch job does not wait on imports it never uses
+if TYPE_CHECKING:
+    from api import OKXDexClient
+
+DEFAULT_SLIPPAGE = "0.005"
+# lines read from the input per chunk, the reader never holds more than one chunk ahead of the workers
+READ_HINT = 1 << 16
+
+
+class BatchError(Exception):
+    pass
+
+
+def _require(op: dict, *names: str) -> list:
+    missing = [name for name in names if op.get(name) in (None, "")]
+    if missing:
+        raise BatchError("missing field(s): {}".format(", ".join(missing)))
+    return [op[name] for name in names]
+
+
+class BatchRunner:
+    # one pooled OKXDexClient and the pooled rpc node sessions, shared by every operation of the stream
+    def __init__(self, api_key: str, secret_key: str, pass_phrase: str, nodes: Optional[dict[int, str]] = None,
+                 timeout: Optional[int] = None, proxy_url: Optional[str] = None, domain_name: Optional[str] = None):
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.pass_phrase = pass_phrase
+        self.nodes = nodes or {}
+        self.timeout = timeout
+        self.proxy_url = proxy_url
+        self.domain_name = domain_name
+
+        self._client: Optional["OKXDexClient"] = None
+        self._rpc_used = False
+
+    def client(self) -> "OKXDexClient":
+        if self._client is None:
+            from api import OKXDexClient, DOMAIN_NAME
+            self._client = OKXDexClient(self.api_key, self.secret_key, self.pass_phrase, proxy_url=self.proxy_url,
+                                        domain_name=self.domain_name or DOMAIN_NAME)
+        return self._client
+
+    def _node_url(self, op: dict) -> str:
+        node_url = op.get("node_url") or self.nodes.get(int(op["chain_idx"]))
+        if not node_url:
+            raise BatchError("no rpc node for chain {}".format(op["chain_idx"]))
+        return node_url
+
+    async def quote(self, op: dict) -> Any:
+        from _decimal import Decimal
+        from api import SwapMode
+        chain_idx, amount, from_addr, to_addr = _require(op, "chain_idx", "amount", "from_token_contract_addr",
+                                                         "to_token_contract_addr")
+        return await self.client().get_aggregator_quote(
+            int(chain_idx), SwapMode(op.get("swap_mode", "exactIn")), int(amount), from_addr, to_addr,
+            Decimal(str(op.get("slippage", DEFAULT_SLIPPAGE))), self.timeout)
+
+    async def swap_build(self, op: dict) -> Any:
+        from _decimal import Decimal
+        from api import SwapMode
+        chain_idx, amount, from_addr, to_addr, user_addr = _require(
+            op, "chain_idx", "amount", "from_token_contract_addr", "to_token_contract_addr", "user_addr")
+        return await self.client().get_aggregator_swap(
+            int(chain_idx), SwapMode(op.get("swap_mode", "exactIn")), int(amount), from_addr, to_addr, user_addr,
+            Decimal(str(op.get("slippage", DEFAULT_SLIPPAGE))), self.timeout)
+
+    async def history(self, op: dict) -> Any:
+        chain_idx, tx_hash = _require(op, "chain_idx", "tx_hash")
+        return await self.client().get_aggregator_history(int(chain_idx), tx_hash, self.timeout)
+
+    async def allowance(self, op: dict) -> Any:
+        # a raw eth_call over the pooled node session, web3 is never loaded for it
+        from rpc.batch import allowance_read, batch_read
+        _require(op, "chain_idx", "token_addr", "owner_addr", "spender_addr")
+        self._rpc_used = True
+        res = (await batch_read(self._node_url(op), [allowance_read(op["token_addr"], op["owner_addr"],
+                                                                    op["spender_addr"])]))[0]
+        if not res.ok:
+            raise BatchError(res.error)
+        return str(res.value)
+
+    def handler(self, name: str) -> Callable[[dict], Awaitable[Any]]:
+        handler = {
+            "quote": self.quote,
+            "swap-build": self.swap_build,
+            "history": self.history,
+            "allowance": self.allowance,
+        }.get(name)
+        if handler is None:
+            raise BatchError("unknown op {!r}".format(name))
+        return handler
+
+    async def run_op(self, line_no: int, line: str) -> dict:
+        record: dict[str, Any] = {"line": line_no}
+        try:
+            op = json.loads(line)
+            if not isinstance(op, dict):
+                raise BatchError("operation must be a json object")
+            if "id" in op:
+                record["id"] = op["id"]
+            record["op"] = op.get("op")
+            result = await self.handler(op.get("op"))(op)
+        except Exception as ex:
+            record["ok"] = False
+            record["error"] = str(ex) or type(ex).__name__
+            return record
+        # an OKX answer with a non-zero code is a failed operation as well
+        record["ok"] = not (isinstance(result, dict) and result.get("code") not in (None, "0", 0))
+        record["result"] = result
+        return record
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+        if self._rpc_used:
+            from rpc import close_nodes
+            await close_nodes()
+
+
+def _lines(chunk: list[str], start: int) -> Iterator[tuple[int, str]]:
+    for i, line in enumerate(chunk, start):
+        if line.strip():
+            yield i, line
+
+
+async def run_stream(runner: BatchRunner, input_stream: IO[str], output_stream: IO[str],
+                     concurrency: int = 32) -> tuple[int, int]:
+    # results are written in completion order; at most `concurrency` operations run and one read chunk
+    # is held at a time, so memory stays flat however long the input is. returns (succeeded, failed)
+    loop = asyncio.get_running_loop()
+    pending: set[asyncio.Task] = set()
+    succeeded = failed = 0
+    line_no = 1
+
+    def write(tasks: set[asyncio.Task]) -> None:
+        nonlocal succeeded, failed
+        for task in tasks:
+            record = task.result()
+            if record["ok"]:
+                succeeded += 1
+            else:
+                failed += 1
+            output_stream.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+        output_stream.flush()
+
+    try:
+        while True:
+            # the blocking read runs in a thread, pipes and regular files alike
+            chunk = await loop.run_in_executor(None, input_stream.readlines, READ_HINT)
+            if not chunk:
+                break
+            for i, line in _lines(chunk, line_no):
+                if len(pending) >= concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    write(done)
+                pending.add(asyncio.ensure_future(runner.run_op(i, line)))
+            line_no += len(chunk)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            write(done)
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            # the cancelled operations finish before the caller closes the client under them
+            await asyncio.gather(*pending, return_exceptions=True)
+    return succeeded, failed
+
+
+def _parse_node(value: str) -> tuple[int, str]:
+    chain_idx, sep, node_url = value.partition("=")
+    if not sep or not chain_idx.isdigit():
+        raise argparse.ArgumentTypeError("expected CHAIN_IDX=URL, got {!r}".format(value))
+    return int(chain_idx), node_url
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m cli",
+        description="run a JSONL stream of operations (quote, swap-build, allowance, history), "
+                    "write one JSONL result per operation in completion order")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file, - for stdin (default)")
+    parser.add_argument("-o", "--output", default="-", help="result file, - for stdout (default)")
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=int, default=None, help="per request timeout in seconds")
+    parser.add_argument("--node", type=_parse_node, action="append", default=[], metavar="CHAIN_IDX=URL",
+                        help="rpc node for allowance operations, repeatable")
+    parser.add_argument("--domain-name", default=None, help="OKX API base url")
+    parser.add_argument("--env-file", default=None,
+                        help="dotenv file with API_KEY / API_SECRET / API_PASSPHRASE, the environment otherwise")
+    args = parser.parse_args(argv)
+
+    if args.env_file is not None:
+        from dotenv import load_dotenv
+        load_dotenv(args.env_file)
+
+    runner = BatchRunner(os.getenv("API_KEY") or "", os.getenv("API_SECRET") or "",
+                         os.getenv("API_PASSPHRASE") or "", dict(args.node), args.timeout,
+                         domain_name=args.domain_name)
+    input_stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output_stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+
+    async def run() -> tuple[int, int]:
+        try:
+            return await run_stream(runner, input_stream, output_stream, args.concurrency)
+        finally:
+            await runner.close()
+
+    try:
+        succeeded, failed = asyncio.run(run())
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+    print("{} succeeded, {} failed".format(succeeded, failed), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,102 +2,316 @@
 # encoding: utf-8
 
 import asyncio
-from typing import Optional, Any
+import time
+from typing import Optional, Any, Awaitable, TypeVar, TYPE_CHECKING
+
+import aiohttp
+
+from utils import release_session
+from utils.instrument import Instrumentation, current_request
+
+# web3 and eth_account take about a second to import, they are imported by the first call that needs them
+if TYPE_CHECKING:
+    from eth_account.datastructures import SignedTransaction
+    from hexbytes import HexBytes
+    from web3 import AsyncWeb3
+    from web3.contract import AsyncContract
+
+T = TypeVar("T")
+
+ERC20_ABI = [
+    {
+        "constant": True,
+        "inputs": [
+            {"name": "_owner", "type": "address"},
+            {"name": "_spender", "type": "address"}
+        ],
+        "name": "allowance",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "payable": False,
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [
+            {"name": "_owner", "type": "address"}
+        ],
+        "name": "balanceOf",
+        "outputs": [{"name": "balance", "type": "uint256"}],
+        "payable": False,
+        "stateMutability": "view",
+        "type": "function"
+    }
+]
+
+# errors meaning the node could not be reached or refused to serve, as opposed to a failed call
+CONNECTION_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+_instrumentation: Optional[Instrumentation] = None
+
+
+def set_instrumentation(instrumentation: Optional[Instrumentation]) -> None:
+    # applies to node sessions created afterwards, call it before the first request or after close_nodes()
+    global _instrumentation
+    _instrumentation = instrumentation
+
+
+def get_instrumentation() -> Optional[Instrumentation]:
+    return _instrumentation
+
+
+def _to_checksum_address(addr: str) -> str:
+    from eth_utils import to_checksum_address
+    return to_checksum_address(addr)
+
+
+def _rpc_error_code(res: Any) -> Optional[str]:
+    for item in res if isinstance(res, list) else (res,):
+        if isinstance(item, dict) and isinstance(item.get("error"), dict):
+            return str(item["error"].get("code"))
+    return None
+
+
+class RpcNode:
+    # one pooled keep-alive session, AsyncWeb3 instance and contract cache per node url
+    def __init__(self, node_url: str, timeout: int = 10, limit: int = 100,
+                 ttl_dns_cache: Optional[int] = 300, keepalive_timeout: float = 30.0,
+                 max_failures: int = 3):
+        self.node_url = node_url
+        self.timeout = timeout
+        self.limit = limit
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.max_failures = max_failures
+
+        self.success_count = 0
+        self.failure_count = 0
+        self.consecutive_failures = 0
+        self.last_success_ts: Optional[float] = None
+        self.last_failure_ts: Optional[float] = None
+        self.last_error: Optional[BaseException] = None
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._w3: Optional["AsyncWeb3"] = None
+        self._contracts: dict[str, "AsyncContract"] = {}
+
+    @property
+    def healthy(self) -> bool:
+        return self.consecutive_failures < self.max_failures
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            release_session(self._session, self._loop)
+            connector = aiohttp.TCPConnector(limit=self.limit, ttl_dns_cache=self.ttl_dns_cache,
+                                             keepalive_timeout=self.keepalive_timeout)
+            trace_configs = [_instrumentation.trace_config()] if _instrumentation is not None else None
+            self._session = aiohttp.ClientSession(connector=connector, raise_for_status=True,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                                  trace_configs=trace_configs)
+            self._loop = loop
+            self._w3 = None
+            self._contracts = {}
+        return self._session
+
+    async def get_web3(self) -> "AsyncWeb3":
+        session = await self.get_session()
+        if self._w3 is None:
+            from web3 import AsyncWeb3
+
+            # eth_chainId never changes for a node, cache it instead of asking on every validated call.
+            # no web3 retries: a dead node is reported at once, the health stats and the router fail over
+            provider = AsyncWeb3.AsyncHTTPProvider(
+                self.node_url, request_kwargs={"timeout": aiohttp.ClientTimeout(total=self.timeout)},
+                exception_retry_configuration=None, cache_allowed_requests=True, cacheable_requests={"eth_chainId"},
+                request_cache_validation_threshold=None)
+            await provider.cache_async_session(session)
+            self._w3 = AsyncWeb3(provider)
+        return self._w3
+
+    async def get_erc20(self, token_addr: str) -> "AsyncContract":
+        w3 = await self.get_web3()
+        token_addr = _to_checksum_address(token_addr)
+        contract = self._contracts.get(token_addr)
+        if contract is None:
+            contract = w3.eth.contract(address=token_addr, abi=ERC20_ABI)
+            self._contracts[token_addr] = contract
+        return contract
+
+    def record_success(self) -> None:
+        self.success_count += 1
+        self.consecutive_failures = 0
+        self.last_success_ts = time.time()
+
+    def record_failure(self, error: BaseException) -> None:
+        self.failure_count += 1
+        self.consecutive_failures += 1
+        self.last_failure_ts = time.time()
+        self.last_error = error
+
+    async def call(self, aw: Awaitable[T], method: str = "web3") -> Optional[T]:
+        # health comes from real call outcomes; an unreachable node yields None like the old is_connected check
+        instrumentation = _instrumentation
+        if instrumentation is None:
+            try:
+                res = await aw
+            except CONNECTION_ERRORS as ex:
+                self.record_failure(ex)
+                return None
+            self.record_success()
+            return res
+
+        ctx = instrumentation.start("rpc", method)
+        token = current_request.set(ctx)
+        error_code = None
+        try:
+            res = await aw
+        except CONNECTION_ERRORS as ex:
+            error_code = type(ex).__name__
+            self.record_failure(ex)
+            return None
+        except BaseException as ex:
+            error_code = type(ex).__name__
+            raise
+        finally:
+            current_request.reset(token)
+            instrumentation.finish(ctx, error_code=error_code)
+        self.record_success()
+        return res
+
+    async def post(self, payload: Any) -> Any:
+        # raw JSON-RPC over the pooled session, payload may be a single request or a batch array
+        session = await self.get_session()
+        instrumentation = _instrumentation
+        ctx = None
+        if instrumentation is not None:
+            ctx = instrumentation.start("rpc", "batch" if isinstance(payload, list) else payload.get("method", "rpc"))
+        error_code = None
+        try:
+            async with session.post(self.node_url, json=payload, trace_request_ctx=ctx) as response:
+                res = await response.json(content_type=None)
+            if ctx is not None:
+                error_code = _rpc_error_code(res)
+        except CONNECTION_ERRORS + (ValueError,) as ex:
+            # ValueError: the body is not JSON, the node is as unusable as an unreachable one
+            error_code = type(ex).__name__
+            self.record_failure(ex)
+            raise
+        finally:
+            if ctx is not None:
+                instrumentation.finish(ctx, error_code=error_code)
+        self.record_success()
+        return res
+
+    def health(self) -> dict:
+        return {
+            "node_url": self.node_url,
+            "healthy": self.healthy,
+            "success_count": self.success_count,
+            "failure_count": self.failure_count,
+            "consecutive_failures": self.consecutive_failures,
+            "last_success_ts": self.last_success_ts,
+            "last_failure_ts": self.last_failure_ts,
+            "last_error": repr(self.last_error) if self.last_error is not None else None,
+        }
 
-from eth_account.datastructures import SignedTransaction
-from hexbytes import HexBytes
-from web3 import AsyncWeb3
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        else:
+            release_session(self._session, self._loop)
+        self._session = None
+        self._loop = None
+        self._w3 = None
+        self._contracts = {}
 
 
-async def check_allowance(_node_url: str, _token_addr: str, _owner_addr: str, _spender_addr: str) -> Optional[int]:
-    token_abi = [
-        {
-            "constant": True,
-            "inputs": [
-                {"name": "_owner", "type": "address"},
-                {"name": "_spender", "type": "address"}
-            ],
-            "name": "allowance",
-            "outputs": [{"name": "", "type": "uint256"}],
-            "payable": False,
-            "stateMutability": "view",
-            "type": "function"
-        }
-    ]
+_nodes: dict[str, RpcNode] = {}
+
+
+def get_node(_node_url: str) -> RpcNode:
+    node = _nodes.get(_node_url)
+    if node is None:
+        node = RpcNode(_node_url)
+        _nodes[_node_url] = node
+    return node
+
+
+def node_health(_node_url: str) -> Optional[dict]:
+    node = _nodes.get(_node_url)
+    return node.health() if node is not None else None
+
 
-    w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(_node_url))
-    connected = await w3.is_connected()
-    if not connected:
-        return None
+async def close_nodes() -> None:
+    for node in list(_nodes.values()):
+        await node.close()
+    _nodes.clear()
 
-    contract = w3.eth.contract(
-        address=AsyncWeb3.to_checksum_address(_token_addr),
-        abi=token_abi
-    )
 
-    _owner_addr = AsyncWeb3.to_checksum_address(_owner_addr)
-    _spender_addr = AsyncWeb3.to_checksum_address(_spender_addr)
+async def check_allowance(_node_url: str, _token_addr: str, _owner_addr: str, _spender_addr: str) -> Optional[int]:
+    node = get_node(_node_url)
+    contract = await node.get_erc20(_token_addr)
+
+    _owner_addr = _to_checksum_address(_owner_addr)
+    _spender_addr = _to_checksum_address(_spender_addr)
 
-    res = await contract.functions.allowance(_owner_addr, _spender_addr).call()
+    res = await node.call(contract.functions.allowance(_owner_addr, _spender_addr).call(),
+                          "eth_call")
     return res
 
 
 async def estimate_gas(_node_url: str, _to_addr: str, _from_addr: str, _value: int, _data: bytes) -> Optional[int]:
-    w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(_node_url))
-    connected = await w3.is_connected()
-    if not connected:
-        return None
-
-    gas_limit = await w3.eth.estimate_gas({
-        'from': AsyncWeb3.to_checksum_address(_from_addr),
-        'to': AsyncWeb3.to_checksum_address(_to_addr),
+    node = get_node(_node_url)
+    w3 = await node.get_web3()
+
+    gas_limit = await node.call(w3.eth.estimate_gas({
+        'from': _to_checksum_address(_from_addr),
+        'to': _to_checksum_address(_to_addr),
         'value': w3.to_wei(_value, 'wei'),
         'data': _data,
-    })
+    }), "eth_estimateGas")
 
     return gas_limit
 
 
 async def check_nonce(_node_url: str, _from_addr: str) -> Optional[int]:
-    w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(_node_url))
-    connected = await w3.is_connected()
-    if not connected:
-        return None
+    node = get_node(_node_url)
+    w3 = await node.get_web3()
 
-    nonce = await w3.eth.get_transaction_count(AsyncWeb3.to_checksum_address(_from_addr))
+    nonce = await node.call(w3.eth.get_transaction_count(_to_checksum_address(_from_addr)),
+                            "eth_getTransactionCount")
     return nonce
 
 
+async def get_gas_price(_node_url: str) -> Optional[int]:
+    node = get_node(_node_url)
+    w3 = await node.get_web3()
+
+    gas_price = await node.call(w3.eth.gas_price, "eth_gasPrice")
+    return gas_price
+
+
 async def build_and_sign_transaction(_node_url: str, _from_addr: str, _to_addr: str, _value: int, _data: bytes,
                                      _gas_price: int, _gas_limit: int, _nonce: int, _chain_id: int,
-                                     _private_key: bytes) -> Optional[SignedTransaction]:
-    w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(_node_url))
-    connected = await w3.is_connected()
-    if not connected:
-        return None
-
-    tx = {
-        "from": AsyncWeb3.to_checksum_address(_from_addr),
-        "to": AsyncWeb3.to_checksum_address(_to_addr),
-        "data": _data,
-        "value": _value,
-        "gas": _gas_limit,
-        "gasPrice": _gas_price,
-        "nonce": _nonce,
-        "chainId": _chain_id,
-    }
+                                     _private_key: bytes) -> Optional["SignedTransaction"]:
+    # signing is local, _node_url is kept for compatibility. rpc.signer signs batches off the event loop
+    from eth_account import Account
+    from rpc.signer import build_transaction
 
-    signed_tx = w3.eth.account.sign_transaction(tx, private_key=_private_key)
+    tx = build_transaction(_to_addr, _value, _data, _gas_limit, _nonce, _chain_id,
+                           _gas_price=_gas_price, _from_addr=_from_addr)
+
+    signed_tx = Account.sign_transaction(tx, private_key=_private_key)
     return signed_tx
 
 
-async def broadcast_transaction(_node_url: str, _raw_transaction: bytes) -> Optional[HexBytes]:
-    w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(_node_url))
-    connected = await w3.is_connected()
-    if not connected:
-        return None
+async def broadcast_transaction(_node_url: str, _raw_transaction: bytes) -> Optional["HexBytes"]:
+    node = get_node(_node_url)
+    w3 = await node.get_web3()
 
-    tx_hash = await w3.eth.send_raw_transaction(_raw_transaction)
+    tx_hash = await node.call(w3.eth.send_raw_transaction(_raw_transaction), "eth_sendRawTransaction")
     return tx_hash
 
 
@@ -160,5 +374,8 @@ if __name__ == "__main__":
         r5 = await asyncio.gather(fut5, )
         print(r5)
 
+        print(node_health(url))
+        await close_nodes()
+
 
     asyncio.run(func())
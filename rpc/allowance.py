@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+from typing import Optional, Iterable
+
+from rpc.batch import allowance_read, batch_call, multicall_read
+
+APPROVAL_TOPIC = "0x8c5be1e5ebec7d5bd14f71427d1e84f3dd0314c0f7b2291e5b200ac8c7c3b925"
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+# most tokens never decrement an infinite allowance
+MAX_UINT256 = 2 ** 256 - 1
+
+AllowanceKey = tuple[int, str, str, str]
+
+
+def _topic_addr(addr: str) -> str:
+    return "0x" + addr.lower()[2:].rjust(64, "0")
+
+
+def _addr_from_topic(topic: str) -> str:
+    return "0x" + topic[-40:].lower()
+
+
+class AllowanceCache:
+    # (chain, token, owner, spender) => allowance, loaded in bulk through multicall, decremented locally by
+    # our own swaps and corrected from Approval / Transfer logs of the tracked owners
+    def __init__(self, nodes: dict[int, str], poll_interval: float = 3.0, max_block_range: int = 2000):
+        self.nodes = nodes
+        self.poll_interval = poll_interval
+        self.max_block_range = max_block_range
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.last_error: Optional[str] = None
+
+        self._values: dict[AllowanceKey, int] = {}
+        # every key ever loaded, invalidated keys stay here so the poller can reload them
+        self._tracked: set[AllowanceKey] = set()
+        self._stale: set[AllowanceKey] = set()
+        # last block whose logs were applied, per chain
+        self._cursors: dict[int, int] = {}
+        # our own spending txs, their Transfer logs are already accounted for; insertion ordered, bounded
+        self._own_txs: dict[str, None] = {}
+        self.max_own_txs = 4096
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def make_key(chain_id: int, token_addr: str, owner_addr: str, spender_addr: str) -> AllowanceKey:
+        return chain_id, token_addr.lower(), owner_addr.lower(), spender_addr.lower()
+
+    async def load(self, chain_id: int, entries: Iterable[tuple[str, str, str]]) -> dict[AllowanceKey, int]:
+        # (token, owner, spender) entries, all read through multicall in as few requests as possible
+        keys = [self.make_key(chain_id, *entry) for entry in entries]
+        if not keys:
+            return {}
+        if chain_id not in self._cursors:
+            # logs are applied from the block the values were read at
+            head = (await batch_call(self.nodes[chain_id], [("eth_blockNumber", [])]))[0]
+            if head.ok:
+                self._cursors[chain_id] = int(head.value, 16)
+        results = await multicall_read(self.nodes[chain_id],
+                                       [allowance_read(token, owner, spender) for _, token, owner, spender in keys])
+        loaded = {}
+        for key, res in zip(keys, results):
+            self._tracked.add(key)
+            if res.ok:
+                self._values[key] = res.value
+                self._stale.discard(key)
+                loaded[key] = res.value
+            else:
+                self.last_error = res.error
+        return loaded
+
+    def get(self, chain_id: int, token_addr: str, owner_addr: str, spender_addr: str) -> Optional[int]:
+        # local only, None when unknown or invalidated
+        return self._values.get(self.make_key(chain_id, token_addr, owner_addr, spender_addr))
+
+    async def allowance(self, chain_id: int, token_addr: str, owner_addr: str, spender_addr: str) -> Optional[int]:
+        key = self.make_key(chain_id, token_addr, owner_addr, spender_addr)
+        value = self._values.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        return (await self.load(chain_id, [(token_addr, owner_addr, spender_addr)])).get(key)
+
+    def spend(self, chain_id: int, token_addr: str, owner_addr: str, spender_addr: str, amount: int,
+              tx_hash: Optional[str] = None) -> None:
+        # our own swap spent amount through spender; with tx_hash its Transfer log is not applied again
+        key = self.make_key(chain_id, token_addr, owner_addr, spender_addr)
+        value = self._values.get(key)
+        if value is not None and value != MAX_UINT256:
+            self._values[key] = max(0, value - amount)
+        if tx_hash is not None:
+            self._own_txs[tx_hash.lower()] = None
+            if len(self._own_txs) > self.max_own_txs:
+                del self._own_txs[next(iter(self._own_txs))]
+
+    def set(self, chain_id: int, token_addr: str, owner_addr: str, spender_addr: str, amount: int) -> None:
+        key = self.make_key(chain_id, token_addr, owner_addr, spender_addr)
+        self._tracked.add(key)
+        self._stale.discard(key)
+        self._values[key] = amount
+
+    def invalidate(self, chain_id: int, token_addr: str, owner_addr: str, spender_addr: str) -> None:
+        self._invalidate(self.make_key(chain_id, token_addr, owner_addr, spender_addr))
+
+    def _invalidate(self, key: AllowanceKey) -> None:
+        if self._values.pop(key, None) is not None:
+            self.invalidations += 1
+        if key in self._tracked:
+            self._stale.add(key)
+
+    def watch_approve(self, future: asyncio.Future, chain_id: int, token_addr: str, owner_addr: str,
+                      spender_addr: str) -> None:
+        # future of rpc.tracker.TxTracker.track for our approve tx, the value is reloaded once it is mined
+        key = self.make_key(chain_id, token_addr, owner_addr, spender_addr)
+        self._tracked.add(key)
+        future.add_done_callback(lambda f: None if f.cancelled() else self._invalidate(key))
+
+    def _apply_logs(self, chain_id: int, logs: list[dict]) -> None:
+        for log in logs:
+            topics = log.get("topics") or []
+            if len(topics) < 3:
+                continue
+            token = str(log.get("address", "")).lower()
+            owner = _addr_from_topic(topics[1])
+            if topics[0] == APPROVAL_TOPIC:
+                key = (chain_id, token, owner, _addr_from_topic(topics[2]))
+                if key in self._tracked:
+                    data = log.get("data") or "0x"
+                    # removed: the log was reorged out
+                    if log.get("removed") or len(data) < 66:
+                        self._invalidate(key)
+                    else:
+                        # the event carries the new allowance
+                        self._values[key] = int(data[2:66], 16)
+                        self._stale.discard(key)
+            elif topics[0] == TRANSFER_TOPIC:
+                if str(log.get("transactionHash", "")).lower() in self._own_txs:
+                    continue
+                # a Transfer does not name the spender, drop every allowance of the owner on this token
+                for key in [k for k in self._tracked if k[0] == chain_id and k[1] == token and k[2] == owner]:
+                    self._invalidate(key)
+
+    async def poll_once(self, chain_id: int) -> None:
+        node_url = self.nodes[chain_id]
+        keys = [key for key in self._tracked if key[0] == chain_id]
+        head = (await batch_call(node_url, [("eth_blockNumber", [])]))[0]
+        if not head.ok:
+            self.last_error = head.error
+            return
+        head_block = int(head.value, 16)
+        from_block = self._cursors.get(chain_id, head_block) + 1
+        if keys and from_block <= head_block:
+            tokens = sorted({key[1] for key in keys})
+            owners = sorted({_topic_addr(key[2]) for key in keys})
+            ranges = [(start, min(head_block, start + self.max_block_range - 1))
+                      for start in range(from_block, head_block + 1, self.max_block_range)]
+            results = await batch_call(node_url, [
+                ("eth_getLogs", [{"fromBlock": hex(start), "toBlock": hex(end), "address": tokens,
+                                  "topics": [[APPROVAL_TOPIC, TRANSFER_TOPIC], owners]}])
+                for start, end in ranges])
+            for res in results:
+                if not res.ok:
+                    # the cursor stays, the same range is asked again next time
+                    self.last_error = res.error
+                    return
+            for res in results:
+                self._apply_logs(chain_id, res.value or [])
+        self._cursors[chain_id] = head_block
+
+        stale = [key for key in self._stale if key[0] == chain_id]
+        if stale:
+            await self.load(chain_id, [key[1:] for key in stale])
+
+    async def _poll(self) -> None:
+        while True:
+            for chain_id in list(self.nodes):
+                try:
+                    await self.poll_once(chain_id)
+                except Exception as ex:
+                    self.last_error = repr(ex)
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._values),
+            "tracked": len(self._tracked),
+            "stale": len(self._stale),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+if __name__ == "__main__":
+    from rpc import close_nodes
+
+    url = "https://public-bsc.nownodes.io"
+    token_addr = "0x55d398326f99059ff775485246999027b3197955"
+    owner_addr = "0x429752d5f5b595340381b158d80e846f9b20b6da"
+    spender_addr = "0x2c34a2fb1d0b4f55de51e1d0bdefaddce6b7cdd6"
+
+
+    async def func():
+        cache = AllowanceCache({56: url})
+        print(await cache.load(56, [(token_addr, owner_addr, spender_addr)]))
+        cache.start()
+        await asyncio.sleep(10)
+        print(await cache.allowance(56, token_addr, owner_addr, spender_addr), cache.stats())
+        await cache.stop()
+        await close_nodes()
+
+
+    asyncio.run(func())
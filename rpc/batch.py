@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+from typing import Optional, Any, Callable, NamedTuple, Iterable
+
+from rpc import get_node, close_nodes, CONNECTION_ERRORS
+
+MULTICALL3_ADDR = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+ALLOWANCE_SELECTOR = bytes.fromhex("dd62ed3e")
+BALANCE_OF_SELECTOR = bytes.fromhex("70a08231")
+AGGREGATE3_SELECTOR = bytes.fromhex("82ad56cb")
+
+
+class BatchRead(NamedTuple):
+    method: str
+    params: list
+    decode: Callable[[bytes], Any]
+    # (to, calldata) when the read is a plain eth_call on latest that multicall can fold
+    call: Optional[tuple[str, bytes]] = None
+
+
+class BatchResult(NamedTuple):
+    value: Any = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _encode_addr(addr: str) -> bytes:
+    return bytes.fromhex(addr[2:] if addr.startswith(("0x", "0X")) else addr).rjust(32, b"\x00")
+
+
+def _decode_uint256(data: bytes) -> int:
+    if len(data) < 32:
+        raise ValueError("short return data: 0x{}".format(data.hex()))
+    return int.from_bytes(data[:32], "big")
+
+
+def _decode_quantity(data: bytes) -> int:
+    return int.from_bytes(data, "big")
+
+
+def _hex_to_bytes(value: str) -> bytes:
+    value = value[2:] if value.startswith("0x") else value
+    if len(value) % 2:
+        value = "0" + value
+    return bytes.fromhex(value)
+
+
+def eth_call_read(to_addr: str, data: bytes, decoder: Callable[[bytes], Any] = bytes,
+                  block: str = "latest") -> BatchRead:
+    params = [{"to": to_addr, "data": "0x" + data.hex()}, block]
+    call = (to_addr, data) if block == "latest" else None
+    return BatchRead("eth_call", params, decoder, call)
+
+
+def allowance_read(token_addr: str, owner_addr: str, spender_addr: str) -> BatchRead:
+    data = ALLOWANCE_SELECTOR + _encode_addr(owner_addr) + _encode_addr(spender_addr)
+    return eth_call_read(token_addr, data, _decode_uint256)
+
+
+def balance_of_read(token_addr: str, owner_addr: str) -> BatchRead:
+    data = BALANCE_OF_SELECTOR + _encode_addr(owner_addr)
+    return eth_call_read(token_addr, data, _decode_uint256)
+
+
+def eth_balance_read(addr: str, block: str = "latest") -> BatchRead:
+    return BatchRead("eth_getBalance", [addr, block], _decode_quantity)
+
+
+def nonce_read(addr: str, block: str = "pending") -> BatchRead:
+    return BatchRead("eth_getTransactionCount", [addr, block], _decode_quantity)
+
+
+def _error_str(ex: BaseException) -> str:
+    return "{}: {}".format(type(ex).__name__, ex)
+
+
+def _response_error(response: Any) -> Optional[str]:
+    # nodes are not consistent here, "error" may be an object with a message or a bare string
+    if response is None:
+        return "missing response"
+    if not isinstance(response, dict):
+        return "malformed response: {!r}".format(response)
+    error = response.get("error")
+    if error is None:
+        return None
+    if isinstance(error, dict):
+        return str(error.get("message", error))
+    return str(error)
+
+
+def _decode_item(item: BatchRead, response: Optional[dict]) -> BatchResult:
+    error = _response_error(response)
+    if error is not None:
+        return BatchResult(error=error)
+    try:
+        return BatchResult(value=item.decode(_hex_to_bytes(response.get("result") or "0x")))
+    except Exception as ex:
+        return BatchResult(error=_error_str(ex))
+
+
+async def _post_batch(node_url: str, methods: list[tuple[str, list]]) -> list[Optional[dict]]:
+    payload = [{"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+               for i, (method, params) in enumerate(methods)]
+    responses = await get_node(node_url).post(payload)
+    if not isinstance(responses, list):
+        # some nodes answer a rejected batch with a single error object
+        return [responses] * len(methods)
+    by_id = {r.get("id"): r for r in responses if isinstance(r, dict)}
+    return [by_id.get(i) for i in range(len(methods))]
+
+
+async def batch_call(node_url: str, methods: Iterable[tuple[str, list]]) -> list[BatchResult]:
+    # raw JSON-RPC results in one batch, for methods whose results are not plain hex values
+    methods = list(methods)
+    try:
+        responses = await _post_batch(node_url, methods)
+    except CONNECTION_ERRORS + (ValueError,) as ex:
+        # a body that is not JSON (a proxy error page, a truncated answer) fails every item like a transport error
+        return [BatchResult(error=_error_str(ex))] * len(methods)
+    results = []
+    for response in responses:
+        error = _response_error(response)
+        results.append(BatchResult(error=error) if error is not None else BatchResult(value=response.get("result")))
+    return results
+
+
+async def batch_read(node_url: str, reads: Iterable[BatchRead], max_batch_size: int = 100) -> list[BatchResult]:
+    reads = list(reads)
+    chunks = [reads[i:i + max_batch_size] for i in range(0, len(reads), max_batch_size)]
+
+    async def run_chunk(chunk: list[BatchRead]) -> list[BatchResult]:
+        try:
+            responses = await _post_batch(node_url, [(item.method, item.params) for item in chunk])
+        except CONNECTION_ERRORS + (ValueError,) as ex:
+            return [BatchResult(error=_error_str(ex))] * len(chunk)
+        return [_decode_item(item, response) for item, response in zip(chunk, responses)]
+
+    results = await asyncio.gather(*[run_chunk(chunk) for chunk in chunks])
+    return [r for chunk_results in results for r in chunk_results]
+
+
+async def multicall_read(node_url: str, reads: Iterable[BatchRead], multicall_addr: str = MULTICALL3_ADDR,
+                         max_calls: int = 500, max_batch_size: int = 100) -> list[BatchResult]:
+    # fold foldable eth_calls into Multicall3 aggregate3 calls, everything is then sent as JSON-RPC batches
+    from eth_abi import encode, decode
+
+    reads = list(reads)
+    folded = [i for i, item in enumerate(reads) if item.call is not None]
+    groups = [folded[i:i + max_calls] for i in range(0, len(folded), max_calls)]
+
+    requests: list[BatchRead] = []
+    for group in groups:
+        calls = [(reads[i].call[0], True, reads[i].call[1]) for i in group]
+        data = AGGREGATE3_SELECTOR + encode(["(address,bool,bytes)[]"], [calls])
+        requests.append(eth_call_read(multicall_addr, data,
+                                      lambda d: decode(["(bool,bytes)[]"], d)[0]))
+    plain = [i for i, item in enumerate(reads) if item.call is None]
+    requests.extend(reads[i] for i in plain)
+
+    responses = await batch_read(node_url, requests, max_batch_size)
+
+    results: list[BatchResult] = [BatchResult(error="missing response")] * len(reads)
+    for group, response in zip(groups, responses):
+        if not response.ok:
+            for i in group:
+                results[i] = BatchResult(error=response.error)
+            continue
+        for i, (success, return_data) in zip(group, response.value):
+            if not success:
+                results[i] = BatchResult(error="call reverted")
+                continue
+            try:
+                results[i] = BatchResult(value=reads[i].decode(return_data))
+            except Exception as ex:
+                results[i] = BatchResult(error=_error_str(ex))
+    for i, response in zip(plain, responses[len(groups):]):
+        results[i] = response
+    return results
+
+
+if __name__ == "__main__":
+    url = "https://public-bsc.nownodes.io"
+    token_addr = "0x55d398326f99059ff775485246999027b3197955"
+    owner_addr = "0x429752d5f5b595340381b158d80e846f9b20b6da"
+    spender_addr = "0x2c34a2fb1d0b4f55de51e1d0bdefaddce6b7cdd6"
+
+
+    async def func():
+        reads = [
+            allowance_read(token_addr, owner_addr, spender_addr),
+            balance_of_read(token_addr, owner_addr),
+            nonce_read(owner_addr),
+            eth_balance_read(owner_addr),
+        ]
+        print(await batch_read(url, reads))
+        print(await multicall_read(url, reads))
+        await close_nodes()
+
+
+    asyncio.run(func())
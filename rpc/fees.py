@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import time
+from typing import Optional, NamedTuple, Iterable
+
+from rpc.batch import batch_call
+
+
+class FeeSnapshot(NamedTuple):
+    block_number: int
+    gas_price: int
+    # base fee of the next block, None on chains without EIP-1559
+    base_fee: Optional[int]
+    # reward percentile => median priority fee over the sampled blocks
+    priority_fees: dict[float, int]
+    updated_at: float
+
+
+class FeeOracle:
+    # keeps gas price, base fee and priority fee percentiles of one chain in memory, refreshed once per block
+    def __init__(self, node_url: str, chain_id: int, poll_interval: float = 1.0, history_blocks: int = 10,
+                 percentiles: Iterable[float] = (10, 50, 90)):
+        self.node_url = node_url
+        self.chain_id = chain_id
+        self.poll_interval = poll_interval
+        self.history_blocks = history_blocks
+        self.percentiles = tuple(percentiles)
+
+        self.snapshot: Optional[FeeSnapshot] = None
+        self.head_block: Optional[int] = None
+        self.head_seen_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+        # last block whose refresh succeeded, a failed refresh leaves it behind and is retried
+        self._refreshed_block: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def staleness(self) -> Optional[float]:
+        # seconds since the snapshot was taken
+        if self.snapshot is None:
+            return None
+        return time.monotonic() - self.snapshot.updated_at
+
+    @property
+    def blocks_behind(self) -> Optional[int]:
+        if self.snapshot is None or self.head_block is None:
+            return None
+        return self.head_block - self.snapshot.block_number
+
+    def gas_price(self) -> Optional[int]:
+        return self.snapshot.gas_price if self.snapshot is not None else None
+
+    def eip1559_fees(self, percentile: float = 50, base_fee_multiplier: float = 2) -> Optional[tuple[int, int]]:
+        # (maxFeePerGas, maxPriorityFeePerGas)
+        if self.snapshot is None or self.snapshot.base_fee is None:
+            return None
+        priority_fee = self.snapshot.priority_fees.get(percentile, 0)
+        return int(self.snapshot.base_fee * base_fee_multiplier) + priority_fee, priority_fee
+
+    async def on_new_block(self, block_number: int) -> None:
+        # entry point for a newHeads subscription, polling calls it as well
+        if self.head_block is None or block_number > self.head_block:
+            self.head_block = block_number
+            self.head_seen_at = time.monotonic()
+        if self._refreshed_block is not None and block_number <= self._refreshed_block:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._refreshed_block is not None and block_number <= self._refreshed_block:
+                return
+            if await self._refresh(block_number):
+                self._refreshed_block = block_number
+
+    async def _refresh(self, block_number: int) -> bool:
+        # True once gas price and fee history are both in, a gas price alone still updates the snapshot
+        gas_price, fee_history = await batch_call(self.node_url, [
+            ("eth_gasPrice", []),
+            ("eth_feeHistory", [hex(self.history_blocks), hex(block_number), list(self.percentiles)]),
+        ])
+        if not gas_price.ok:
+            self.last_error = gas_price.error
+            return False
+
+        base_fee = None
+        priority_fees: dict[float, int] = {}
+        if fee_history.ok and fee_history.value:
+            base_fees = fee_history.value.get("baseFeePerGas") or []
+            if base_fees and base_fees[-1] is not None:
+                # the last entry is the base fee of the block after block_number
+                base_fee = int(base_fees[-1], 16)
+            rewards = fee_history.value.get("reward") or []
+            for i, percentile in enumerate(self.percentiles):
+                samples = sorted(int(r[i], 16) for r in rewards if len(r) > i)
+                if samples:
+                    priority_fees[percentile] = samples[len(samples) // 2]
+        self.snapshot = FeeSnapshot(block_number, int(gas_price.value, 16), base_fee, priority_fees,
+                                    time.monotonic())
+        if not fee_history.ok:
+            self.last_error = fee_history.error
+            return False
+        self.last_error = None
+        return True
+
+    async def poll_once(self) -> None:
+        block_number = (await batch_call(self.node_url, [("eth_blockNumber", [])]))[0]
+        if not block_number.ok:
+            self.last_error = block_number.error
+            return
+        await self.on_new_block(int(block_number.value, 16))
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+            except Exception as ex:
+                self.last_error = repr(ex)
+            await asyncio.sleep(self.poll_interval)
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            await self.poll_once()
+            self._task = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+if __name__ == "__main__":
+    from rpc import close_nodes
+
+    url = "https://public-bsc.nownodes.io"
+
+
+    async def func():
+        oracle = FeeOracle(url, 56)
+        await oracle.start()
+        for _ in range(5):
+            print(oracle.snapshot, oracle.staleness, oracle.blocks_behind)
+            await asyncio.sleep(3)
+        await oracle.stop()
+        await close_nodes()
+
+
+    asyncio.run(func())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, AsyncIterator
+
+from rpc.batch import batch_read, nonce_read
+
+
+class NonceState:
+    def __init__(self):
+        self.next_nonce: Optional[int] = None
+        # allocated, not yet broadcast
+        self.pending: set[int] = set()
+        # broadcast => time it was confirmed sent
+        self.sent: dict[int, float] = {}
+        # handed back or detected as gaps, reused lowest first
+        self.released: set[int] = set()
+        self.synced_at = 0.0
+        self.lock = asyncio.Lock()
+
+
+class NonceManager:
+    # seeds once per (chain, address) from the node, then hands out nonces locally
+    def __init__(self, nodes: dict[int, str], resync_interval: float = 30.0, drop_after: float = 120.0):
+        self.nodes = nodes
+        self.resync_interval = resync_interval
+        self.drop_after = drop_after
+        self._states: dict[tuple[int, str], NonceState] = {}
+
+    def _state(self, chain_id: int, address: str) -> NonceState:
+        key = (chain_id, address.lower())
+        state = self._states.get(key)
+        if state is None:
+            state = NonceState()
+            self._states[key] = state
+        return state
+
+    async def _fetch(self, chain_id: int, address: str) -> int:
+        res = (await batch_read(self.nodes[chain_id], [nonce_read(address, "pending")]))[0]
+        if not res.ok:
+            raise ConnectionError("nonce fetch failed for {} on chain {}: {}".format(address, chain_id, res.error))
+        return res.value
+
+    async def _sync(self, state: NonceState, chain_id: int, address: str) -> list[int]:
+        chain_nonce = await self._fetch(chain_id, address)
+        now = time.monotonic()
+
+        state.released = {n for n in state.released if n >= chain_nonce}
+        # a sent nonce the node still does not count after drop_after was dropped from the mempool
+        state.sent = {n: ts for n, ts in state.sent.items() if n >= chain_nonce and now - ts < self.drop_after}
+        if state.next_nonce is None or chain_nonce > state.next_nonce:
+            # first seed, or transactions sent from elsewhere
+            state.next_nonce = chain_nonce
+
+        gaps = [n for n in range(chain_nonce, state.next_nonce)
+                if n not in state.pending and n not in state.sent and n not in state.released]
+        state.released.update(gaps)
+        state.synced_at = now
+        return gaps
+
+    async def allocate(self, chain_id: int, address: str) -> int:
+        state = self._state(chain_id, address)
+        async with state.lock:
+            if state.next_nonce is None or time.monotonic() - state.synced_at >= self.resync_interval:
+                await self._sync(state, chain_id, address)
+            if state.released:
+                nonce = min(state.released)
+                state.released.discard(nonce)
+            else:
+                nonce = state.next_nonce
+                state.next_nonce += 1
+            state.pending.add(nonce)
+            return nonce
+
+    def confirm(self, chain_id: int, address: str, nonce: int) -> None:
+        # the transaction using nonce was broadcast
+        state = self._state(chain_id, address)
+        state.pending.discard(nonce)
+        state.sent[nonce] = time.monotonic()
+
+    def release(self, chain_id: int, address: str, nonce: int) -> None:
+        # the transaction using nonce was never broadcast, hand the nonce out again
+        state = self._state(chain_id, address)
+        state.pending.discard(nonce)
+        state.sent.pop(nonce, None)
+        if state.next_nonce is None:
+            return
+        state.released.add(nonce)
+        while state.next_nonce - 1 in state.released:
+            state.next_nonce -= 1
+            state.released.discard(state.next_nonce)
+
+    async def resync(self, chain_id: int, address: str) -> list[int]:
+        # returns the gaps found, they are reused by the next allocations
+        state = self._state(chain_id, address)
+        async with state.lock:
+            return await self._sync(state, chain_id, address)
+
+    def reset(self, chain_id: int, address: str) -> None:
+        self._states.pop((chain_id, address.lower()), None)
+
+    @asynccontextmanager
+    async def reserve(self, chain_id: int, address: str) -> AsyncIterator[int]:
+        # confirm on success, release when the body raises
+        nonce = await self.allocate(chain_id, address)
+        try:
+            yield nonce
+        except BaseException:
+            self.release(chain_id, address, nonce)
+            raise
+        self.confirm(chain_id, address, nonce)
+
+
+if __name__ == "__main__":
+    from rpc import close_nodes
+
+    url = "https://public-bsc.nownodes.io"
+    owner_addr = "0x429752d5f5b595340381b158d80e846f9b20b6da"
+
+
+    async def func():
+        manager = NonceManager({56: url})
+        nonces = await asyncio.gather(*[manager.allocate(56, owner_addr) for _ in range(5)])
+        print(nonces)
+        manager.release(56, owner_addr, nonces[2])
+        print(await manager.allocate(56, owner_addr))
+        await close_nodes()
+
+
+    asyncio.run(func())
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import time
+from collections import deque
+from typing import Optional, Any, Awaitable, Callable, Iterable, TypeVar
+
+from hexbytes import HexBytes
+
+import rpc
+from rpc.batch import BatchRead, BatchResult, batch_read
+
+T = TypeVar("T")
+
+
+def _not_none(res: Any) -> bool:
+    return res is not None
+
+
+def _all_ok(res: list[BatchResult]) -> bool:
+    return all(r.ok for r in res)
+
+
+class NodeScore:
+    # rolling latency and error rate of one node url
+    def __init__(self, alpha: float = 0.2, window: int = 100):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, latency: float) -> None:
+        self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+        self.samples.append(latency)
+
+    def record_success(self, latency: float) -> None:
+        self.observe(latency)
+        self.error_rate -= self.alpha * self.error_rate
+
+    def record_failure(self) -> None:
+        self.error_rate += self.alpha * (1 - self.error_rate)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+
+class RpcRouter:
+    # several node urls per chain, reads go to the best scored node and are hedged, broadcasts go to all
+    def __init__(self, nodes: dict[int, Iterable[str]], hedge_percentile: float = 90, hedge_delay: float = 0.2,
+                 min_samples: int = 10, error_penalty: float = 10.0, alpha: float = 0.2, window: int = 100):
+        self.nodes: dict[int, list[str]] = {chain_id: list(urls) for chain_id, urls in nodes.items()}
+        self.hedge_percentile = hedge_percentile
+        # hedge delay used until a node has min_samples latencies
+        self.hedge_delay = hedge_delay
+        self.min_samples = min_samples
+        self.error_penalty = error_penalty
+        self.alpha = alpha
+        self.window = window
+
+        self.hedged = 0
+        self._scores: dict[str, NodeScore] = {}
+        # broadcasts still running on the slower nodes
+        self._background: set[asyncio.Task] = set()
+
+    def add_node(self, chain_id: int, node_url: str) -> None:
+        urls = self.nodes.setdefault(chain_id, [])
+        if node_url not in urls:
+            urls.append(node_url)
+
+    def remove_node(self, chain_id: int, node_url: str) -> None:
+        urls = self.nodes.get(chain_id, [])
+        if node_url in urls:
+            urls.remove(node_url)
+
+    def _score(self, node_url: str) -> NodeScore:
+        score = self._scores.get(node_url)
+        if score is None:
+            score = NodeScore(self.alpha, self.window)
+            self._scores[node_url] = score
+        return score
+
+    def _rank_key(self, node_url: str) -> tuple:
+        score = self._score(node_url)
+        healthy = rpc.get_node(node_url).healthy
+        # nodes without samples go first so every node gets measured, unless they only ever failed
+        latency = score.latency
+        if latency is None:
+            latency = 0.0 if score.error_rate == 0 else self.hedge_delay
+        return not healthy, latency * (1 + self.error_penalty * score.error_rate)
+
+    def ranked(self, chain_id: int) -> list[str]:
+        urls = self.nodes.get(chain_id)
+        if not urls:
+            raise KeyError("no rpc node for chain {}".format(chain_id))
+        return sorted(urls, key=self._rank_key)
+
+    def _hedge_after(self, node_url: str) -> float:
+        score = self._score(node_url)
+        if len(score.samples) < self.min_samples:
+            return self.hedge_delay
+        return score.percentile(self.hedge_percentile)
+
+    async def _timed(self, node_url: str, fn: Callable[[str], Awaitable[T]], is_ok: Callable[[T], bool]) -> T:
+        start = time.perf_counter()
+        try:
+            res = await fn(node_url)
+        except asyncio.CancelledError:
+            # a hedged loser was at least this slow, without it a slow node would never lose its rank
+            self._score(node_url).observe(time.perf_counter() - start)
+            raise
+        except Exception:
+            self._score(node_url).record_failure()
+            raise
+        if is_ok(res):
+            self._score(node_url).record_success(time.perf_counter() - start)
+        else:
+            self._score(node_url).record_failure()
+        return res
+
+    async def read(self, chain_id: int, fn: Callable[[str], Awaitable[T]],
+                   is_ok: Callable[[T], bool] = _not_none, max_attempts: int = 3) -> Optional[T]:
+        # fn(node_url) does the read; a second node is asked when the first one is slower than its
+        # hedge percentile, the next one right away when a node fails. The first ok result wins
+        candidates = self.ranked(chain_id)[:max_attempts]
+        pending: dict[asyncio.Task, str] = {}
+        started: dict[asyncio.Task, float] = {}
+        last_res: Optional[T] = None
+        last_error: Optional[BaseException] = None
+        next_idx = 0
+        # time the winning node took, None while no node answered ok
+        won_in: Optional[float] = None
+
+        def launch() -> None:
+            nonlocal next_idx
+            url = candidates[next_idx]
+            next_idx += 1
+            task = asyncio.ensure_future(self._timed(url, fn, is_ok))
+            pending[task] = url
+            started[task] = time.perf_counter()
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if next_idx < len(candidates):
+                    timeout = self._hedge_after(candidates[next_idx - 1])
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedged += 1
+                    launch()
+                    continue
+                failed = False
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        failed = True
+                        continue
+                    if is_ok(task.result()):
+                        won_in = time.perf_counter() - started[task]
+                        return task.result()
+                    last_res = task.result()
+                    failed = True
+                if failed and next_idx < len(candidates):
+                    launch()
+        finally:
+            now = time.perf_counter()
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            if won_in is not None:
+                # a loser that ran longer than the winner needed timed out in effect, the node health counts it
+                # so a node that keeps losing hedges turns unhealthy and is ranked last
+                for task, url in pending.items():
+                    if now - started[task] >= won_in:
+                        rpc.get_node(url).record_failure(asyncio.TimeoutError("lost a hedged read"))
+        if last_error is not None and last_res is None:
+            raise last_error
+        return last_res
+
+    async def check_allowance(self, chain_id: int, token_addr: str, owner_addr: str,
+                              spender_addr: str) -> Optional[int]:
+        return await self.read(chain_id, lambda url: rpc.check_allowance(url, token_addr, owner_addr, spender_addr))
+
+    async def estimate_gas(self, chain_id: int, to_addr: str, from_addr: str, value: int,
+                           data: bytes) -> Optional[int]:
+        return await self.read(chain_id, lambda url: rpc.estimate_gas(url, to_addr, from_addr, value, data))
+
+    async def check_nonce(self, chain_id: int, from_addr: str) -> Optional[int]:
+        return await self.read(chain_id, lambda url: rpc.check_nonce(url, from_addr))
+
+    async def get_gas_price(self, chain_id: int) -> Optional[int]:
+        return await self.read(chain_id, rpc.get_gas_price)
+
+    async def batch_read(self, chain_id: int, reads: Iterable[BatchRead],
+                         max_batch_size: int = 100) -> list[BatchResult]:
+        reads = list(reads)
+        return await self.read(chain_id, lambda url: batch_read(url, reads, max_batch_size), _all_ok)
+
+    async def broadcast_transaction(self, chain_id: int, raw_transaction: bytes) -> Optional[HexBytes]:
+        # sent to every healthy node at once, returns on the first accepting node and lets the others finish
+        urls = [url for url in self.ranked(chain_id) if rpc.get_node(url).healthy] or self.ranked(chain_id)
+        pending = {asyncio.ensure_future(self._timed(url, lambda u: rpc.broadcast_transaction(u, raw_transaction),
+                                                     _not_none)) for url in urls}
+        first_error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    # e.g. "already known" from a node that got the tx through the mempool first
+                    first_error = first_error or task.exception()
+                elif task.result() is not None:
+                    for other in pending:
+                        self._background.add(other)
+                        other.add_done_callback(self._finish_background)
+                    return task.result()
+        if first_error is not None:
+            raise first_error
+        return None
+
+    def _finish_background(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled():
+            # retrieved so asyncio does not report it
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "hedged": self.hedged,
+            "nodes": {
+                url: {
+                    "latency": score.latency,
+                    "error_rate": score.error_rate,
+                    "p{}".format(self.hedge_percentile): score.percentile(self.hedge_percentile),
+                    "healthy": rpc.get_node(url).healthy,
+                }
+                for url, score in self._scores.items()
+            },
+        }
+
+    async def close(self) -> None:
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    owner_addr = "0x429752d5f5b595340381b158d80e846f9b20b6da"
+
+
+    async def func():
+        router = RpcRouter({56: ["https://public-bsc.nownodes.io", "https://bsc-dataseed.bnbchain.org",
+                                 "https://bsc-rpc.publicnode.com"]})
+        for _ in range(5):
+            print(await router.check_nonce(56, owner_addr), await router.get_gas_price(56))
+        print(router.stats())
+        await router.close()
+        await rpc.close_nodes()
+
+
+    asyncio.run(func())
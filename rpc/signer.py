@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, Iterable
+
+
+def build_transaction(_to_addr: str, _value: int, _data: bytes, _gas_limit: int, _nonce: int, _chain_id: int,
+                      _gas_price: Optional[int] = None, _max_fee_per_gas: Optional[int] = None,
+                      _max_priority_fee_per_gas: Optional[int] = None, _from_addr: Optional[str] = None) -> dict:
+    # EIP-1559 when max fees are given, legacy gasPrice otherwise
+    from eth_utils import to_checksum_address
+
+    tx = {
+        "to": to_checksum_address(_to_addr),
+        "data": _data,
+        "value": _value,
+        "gas": _gas_limit,
+        "nonce": _nonce,
+        "chainId": _chain_id,
+    }
+    if _max_fee_per_gas is not None:
+        tx["type"] = 2
+        tx["maxFeePerGas"] = _max_fee_per_gas
+        tx["maxPriorityFeePerGas"] = _max_priority_fee_per_gas if _max_priority_fee_per_gas is not None else 0
+    elif _gas_price is not None:
+        tx["gasPrice"] = _gas_price
+    else:
+        raise ValueError("either _gas_price or _max_fee_per_gas is required")
+    if _from_addr is not None:
+        tx["from"] = to_checksum_address(_from_addr)
+    return tx
+
+
+def sign_transaction(tx: dict, private_key: bytes) -> bytes:
+    # imported here rather than at module load, pool workers pay for it once on their first job
+    from eth_account import Account
+    return bytes(Account.sign_transaction(tx, private_key=private_key).raw_transaction)
+
+
+def sign_transactions(txs: list[tuple[dict, bytes]]) -> list[bytes]:
+    return [sign_transaction(tx, private_key) for tx, private_key in txs]
+
+
+class OfflineSigner:
+    # signs in a thread or process pool so the event loop keeps running, no node needed
+    def __init__(self, executor: Optional[Executor] = None, max_workers: Optional[int] = None,
+                 use_processes: bool = False, chunk_size: int = 16):
+        self.chunk_size = chunk_size
+        self._owns_executor = executor is None
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers) if use_processes else ThreadPoolExecutor(max_workers)
+        self.executor = executor
+
+    async def sign(self, tx: dict, private_key: bytes) -> bytes:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, sign_transaction, tx, private_key)
+
+    async def sign_batch(self, txs: Iterable[tuple[dict, bytes]]) -> list[bytes]:
+        # one executor job per chunk keeps the per-job overhead low for process pools
+        txs = list(txs)
+        loop = asyncio.get_running_loop()
+        chunks = [txs[i:i + self.chunk_size] for i in range(0, len(txs), self.chunk_size)]
+        results = await asyncio.gather(*[loop.run_in_executor(self.executor, sign_transactions, chunk)
+                                         for chunk in chunks])
+        return [raw for chunk_results in results for raw in chunk_results]
+
+    def close(self) -> None:
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+
+    def __enter__(self) -> "OfflineSigner":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    key = bytes.fromhex("1111111111111111111111111111111111111111111111111111111111111111")
+
+
+    async def func():
+        with OfflineSigner(use_processes=True) as signer:
+            legacy = build_transaction("0xb1b5d6ae7cb737357766e924d11793f0dc4d4444", 0, b"", 21000, 15, 56,
+                                       _gas_price=10 ** 9)
+            eip1559 = build_transaction("0xb1b5d6ae7cb737357766e924d11793f0dc4d4444", 0, b"", 21000, 16, 1,
+                                        _max_fee_per_gas=3 * 10 ** 10, _max_priority_fee_per_gas=10 ** 9)
+            raws = await signer.sign_batch([(legacy, key), (eip1559, key)] * 50)
+            print(len(raws), raws[0].hex(), raws[1].hex())
+
+
+    asyncio.run(func())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import json
+from typing import Optional, Any
+
+from aiohttp import web
+
+import rpc
+from rpc.batch import batch_call, batch_read, nonce_read
+from rpc.router import RpcRouter
+
+
+class StubNode:
+    # mode: "ok" answers every request, "string_error" answers each item with a bare error string,
+    # "html" answers with a body that is not JSON
+    def __init__(self, latency: float = 0.0, mode: str = "ok"):
+        self.latency = latency
+        self.mode = mode
+        self.requests = 0
+
+
+class RpcStubServer:
+    # local stand-in for JSON-RPC nodes, every path is a node of its own with its latency and answer mode
+    def __init__(self, chain_id: int = 56):
+        self.chain_id = chain_id
+        self.nodes: dict[str, StubNode] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/{node}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.url = "http://{}:{}".format(host, self._runner.addresses[0][1])
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def add_node(self, name: str, latency: float = 0.0, mode: str = "ok") -> str:
+        self.nodes[name] = StubNode(latency, mode)
+        return "{}/{}".format(self.url, name)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        node = self.nodes[request.match_info["node"]]
+        node.requests += 1
+        payload = await request.json()
+        await asyncio.sleep(node.latency)
+        if node.mode == "html":
+            return web.Response(status=200, text="<html>502 Bad Gateway</html>", content_type="text/html")
+        if isinstance(payload, list):
+            return web.json_response([self._answer(node, item) for item in payload])
+        return web.json_response(self._answer(node, payload))
+
+    def _answer(self, node: StubNode, item: dict) -> dict:
+        if node.mode == "string_error":
+            return {"jsonrpc": "2.0", "id": item.get("id"), "error": "rate limited"}
+        return {"jsonrpc": "2.0", "id": item.get("id"), "result": self._result(item["method"])}
+
+    def _result(self, method: str) -> Any:
+        if method == "eth_chainId":
+            return hex(self.chain_id)
+        if method == "eth_gasPrice":
+            return hex(10 ** 9)
+        if method == "eth_getTransactionCount":
+            return hex(7)
+        return None
+
+
+async def self_check() -> None:
+    # exercises the router and the batch reads against the stand-in, raises AssertionError on a regression
+    server = RpcStubServer()
+    await server.start()
+    slow_url = server.add_node("slow", latency=0.3)
+    fast_url = server.add_node("fast", latency=0.005)
+    string_error_url = server.add_node("string_error", mode="string_error")
+    html_url = server.add_node("html", mode="html")
+    owner_addr = "0x" + "11" * 20
+    router = RpcRouter({56: [slow_url, fast_url]}, hedge_delay=0.02)
+    try:
+        # hedging: the slow node is asked first (no samples yet), loses to the fast one and is demoted
+        for _ in range(5):
+            res = await router.batch_read(56, [nonce_read(owner_addr)])
+            assert res[0].value == 7, "hedged read failed: {}".format(res)
+        slow = rpc.get_node(slow_url)
+        assert slow.failure_count >= 1, "lost hedges not recorded in node health"
+        assert router.ranked(56) == [fast_url, slow_url], "slow node not ranked last"
+        assert router.hedged >= 1, "no read was hedged"
+
+        # a bare string error is reported per item
+        res = await batch_call(string_error_url, [("eth_chainId", []), ("eth_gasPrice", [])])
+        assert [r.error for r in res] == ["rate limited"] * 2, "string errors: {}".format(res)
+
+        # a body that is not JSON fails every item and counts against the node
+        res = await batch_read(html_url, [nonce_read(owner_addr)] * 2)
+        assert all(not r.ok and r.error.startswith("JSONDecodeError") for r in res), "html body: {}".format(res)
+        assert rpc.get_node(html_url).failure_count == 1, "non-JSON body not counted as a node failure"
+    finally:
+        await router.close()
+        await rpc.close_nodes()
+        await server.stop()
+    print("rpc stub self check passed: {}".format(json.dumps(
+        {name: node.requests for name, node in server.nodes.items()})))
+
+
+if __name__ == "__main__":
+    asyncio.run(self_check())
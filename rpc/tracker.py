@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import time
+from enum import StrEnum
+from typing import Optional, NamedTuple, Iterable, AsyncIterator, TYPE_CHECKING
+
+from rpc.batch import batch_call
+
+if TYPE_CHECKING:
+    from api import OKXDexClient
+
+
+class TxStatus(StrEnum):
+    confirmed: str = "confirmed"
+    reverted: str = "reverted"
+    # another transaction with the same nonce was mined
+    replaced: str = "replaced"
+    timeout: str = "timeout"
+
+
+class TxOutcome(NamedTuple):
+    tx_hash: str
+    status: TxStatus
+    block_number: Optional[int] = None
+    # JSON-RPC receipt, or the history record when the outcome came from the OKX API
+    receipt: Optional[dict] = None
+    # "rpc" or "history"
+    source: str = "rpc"
+
+
+class TrackedTx:
+    def __init__(self, tx_hash: str, future: asyncio.Future, deadline: float, from_addr: Optional[str],
+                 nonce: Optional[int], history_interval: float):
+        self.tx_hash = tx_hash
+        self.future = future
+        self.deadline = deadline
+        self.from_addr = from_addr
+        self.nonce = nonce
+        self.history_interval = history_interval
+        # next history lookup, 0.0 while the node answers for this tx
+        self.history_at = 0.0
+        # the receipt is kept until it has enough confirmations
+        self.receipt: Optional[dict] = None
+
+
+# OKX history status => outcome
+HISTORY_STATUS = {
+    "success": TxStatus.confirmed,
+    "fail": TxStatus.reverted,
+}
+
+
+class TxTracker:
+    # receipts of every tracked tx are fetched in one JSON-RPC batch per new block; when the node fails,
+    # the OKX history endpoint is asked instead, per tx with a doubling interval
+    def __init__(self, node_url: str, chain_id: int, client: Optional["OKXDexClient"] = None,
+                 poll_interval: float = 1.0, timeout: float = 300.0, confirmations: int = 1,
+                 history_min_interval: float = 2.0, history_max_interval: float = 30.0,
+                 max_batch_size: int = 100):
+        self.node_url = node_url
+        self.chain_id = chain_id
+        self.client = client
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.confirmations = confirmations
+        self.history_min_interval = history_min_interval
+        self.history_max_interval = history_max_interval
+        self.max_batch_size = max_batch_size
+
+        self.head_block: Optional[int] = None
+        self.last_error: Optional[str] = None
+        self.rpc_requests = 0
+        self.history_requests = 0
+
+        self._txs: dict[str, TrackedTx] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def __len__(self) -> int:
+        return len(self._txs)
+
+    def _ensure_poller(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._task = loop.create_task(self._poll())
+
+    def track(self, tx_hash: str, from_addr: Optional[str] = None, nonce: Optional[int] = None,
+              timeout: Optional[float] = None) -> asyncio.Future:
+        # from_addr and nonce enable replacement detection; the future resolves to a TxOutcome
+        self._ensure_poller()
+        tx_hash = tx_hash.lower()
+        tracked = self._txs.get(tx_hash)
+        if tracked is not None and not tracked.future.done():
+            return tracked.future
+        future = self._loop.create_future()
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        self._txs[tx_hash] = TrackedTx(tx_hash, future, deadline, from_addr, nonce, self.history_min_interval)
+        # a cancelled future stops the tracking
+        future.add_done_callback(lambda f: self._txs.pop(tx_hash, None) if f.cancelled() else None)
+        return future
+
+    async def wait(self, tx_hash: str, from_addr: Optional[str] = None, nonce: Optional[int] = None,
+                   timeout: Optional[float] = None) -> TxOutcome:
+        return await self.track(tx_hash, from_addr, nonce, timeout)
+
+    async def watch(self, tx_hashes: Iterable[str], timeout: Optional[float] = None) -> AsyncIterator[TxOutcome]:
+        # outcomes in completion order
+        pending = {self.track(tx_hash, timeout=timeout) for tx_hash in tx_hashes}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    def _resolve(self, tracked: TrackedTx, outcome: TxOutcome) -> None:
+        self._txs.pop(tracked.tx_hash, None)
+        if not tracked.future.done():
+            tracked.future.set_result(outcome)
+
+    async def on_new_block(self, block_number: int) -> None:
+        # entry point for a newHeads subscription, polling calls it as well
+        if self.head_block is not None and block_number <= self.head_block:
+            return
+        self.head_block = block_number
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._check_receipts(block_number)
+
+    async def _check_receipts(self, block_number: int) -> None:
+        txs = list(self._txs.values())
+        for i in range(0, len(txs), self.max_batch_size):
+            chunk = txs[i:i + self.max_batch_size]
+            methods = [("eth_getTransactionReceipt", [tracked.tx_hash])
+                       for tracked in chunk if tracked.receipt is None]
+            # the mined nonce of the sender tells a replaced tx from a pending one
+            senders = sorted({tracked.from_addr.lower() for tracked in chunk
+                              if tracked.receipt is None and tracked.from_addr is not None
+                              and tracked.nonce is not None})
+            methods.extend(("eth_getTransactionCount", [addr, hex(block_number)]) for addr in senders)
+            results = []
+            if methods:
+                results = await batch_call(self.node_url, methods)
+                self.rpc_requests += 1
+
+            split = len(results) - len(senders)
+            receipts = iter(results[:split])
+            mined_nonces = {addr: int(res.value, 16) for addr, res in zip(senders, results[split:])
+                            if res.ok and res.value is not None}
+            for tracked in chunk:
+                if tracked.receipt is None:
+                    res = next(receipts)
+                    if not res.ok:
+                        self.last_error = res.error
+                        if tracked.history_at == 0.0:
+                            tracked.history_at = time.monotonic()
+                        continue
+                    # the node answers again, no history lookups needed
+                    tracked.history_at = 0.0
+                    tracked.history_interval = self.history_min_interval
+                    tracked.receipt = res.value
+                if tracked.receipt is not None:
+                    receipt_block = int(tracked.receipt["blockNumber"], 16)
+                    if block_number - receipt_block + 1 < self.confirmations:
+                        continue
+                    status = TxStatus.confirmed if tracked.receipt.get("status") == "0x1" else TxStatus.reverted
+                    self._resolve(tracked, TxOutcome(tracked.tx_hash, status, receipt_block, tracked.receipt))
+                elif tracked.from_addr is not None and tracked.nonce is not None:
+                    mined_nonce = mined_nonces.get(tracked.from_addr.lower())
+                    if mined_nonce is not None and mined_nonce > tracked.nonce:
+                        self._resolve(tracked, TxOutcome(tracked.tx_hash, TxStatus.replaced, block_number))
+
+    async def _check_history(self, tracked: TrackedTx) -> None:
+        self.history_requests += 1
+        try:
+            res = await self.client.get_aggregator_history(self.chain_id, tracked.tx_hash)
+        except Exception as ex:
+            res = None
+            self.last_error = repr(ex)
+        record = None
+        if isinstance(res, dict) and res.get("code") == "0":
+            data = res.get("data")
+            record = data[0] if isinstance(data, list) and data else data if isinstance(data, dict) else None
+        status = HISTORY_STATUS.get(str(record.get("status"))) if record is not None else None
+        if status is not None:
+            height = record.get("height")
+            self._resolve(tracked, TxOutcome(tracked.tx_hash, status, int(height) if height else None,
+                                             record, "history"))
+            return
+        # still pending or unknown, ask less often
+        tracked.history_interval = min(self.history_max_interval, tracked.history_interval * 2)
+        tracked.history_at = time.monotonic() + tracked.history_interval
+
+    async def _fallback(self) -> None:
+        # history lookups for txs the node could not answer
+        now = time.monotonic()
+        due = [tracked for tracked in self._txs.values()
+               if tracked.receipt is None and 0.0 < tracked.history_at <= now]
+        if due:
+            await asyncio.gather(*[self._check_history(tracked) for tracked in due])
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for tracked in list(self._txs.values()):
+            if tracked.deadline <= now:
+                self._resolve(tracked, TxOutcome(tracked.tx_hash, TxStatus.timeout, receipt=tracked.receipt))
+
+    async def poll_once(self) -> None:
+        block_number = (await batch_call(self.node_url, [("eth_blockNumber", [])]))[0]
+        self.rpc_requests += 1
+        if block_number.ok:
+            await self.on_new_block(int(block_number.value, 16))
+        else:
+            self.last_error = block_number.error
+            # node down, every tracked tx becomes due for a history lookup
+            now = time.monotonic()
+            for tracked in self._txs.values():
+                if tracked.history_at == 0.0:
+                    tracked.history_at = now
+        if self.client is not None:
+            await self._fallback()
+        self._expire()
+
+    async def _poll(self) -> None:
+        while True:
+            if self._txs:
+                try:
+                    await self.poll_once()
+                except Exception as ex:
+                    self.last_error = repr(ex)
+            await asyncio.sleep(self.poll_interval)
+
+    async def close(self) -> None:
+        if self._task is not None and self._loop is asyncio.get_running_loop():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        for tracked in list(self._txs.values()):
+            tracked.future.cancel()
+        self._txs.clear()
+
+
+if __name__ == "__main__":
+    from rpc import close_nodes
+
+    url = "https://public-bsc.nownodes.io"
+
+
+    async def func():
+        tracker = TxTracker(url, 56, timeout=30)
+        async for outcome in tracker.watch(["0x" + "ab" * 32, "0x" + "cd" * 32]):
+            print(outcome)
+        await tracker.close()
+        await close_nodes()
+
+
+    asyncio.run(func())
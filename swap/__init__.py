@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import os
+import time
+from typing import Optional, NamedTuple, Awaitable, TypeVar
+
+from _decimal import Decimal
+
+import rpc
+from api import OKXDexClient, SwapMode
+from rpc.allowance import AllowanceCache
+from rpc.fees import FeeOracle
+from rpc.nonce import NonceManager
+from rpc.signer import OfflineSigner, build_transaction
+
+T = TypeVar("T")
+
+NATIVE_TOKEN_ADDR = "0xeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee"
+
+
+class SwapError(Exception):
+    pass
+
+
+class SwapResult(NamedTuple):
+    tx_hash: str
+    approve_tx_hash: Optional[str]
+    nonce: int
+    swap: dict
+    # stage => seconds
+    timings: dict[str, float]
+
+
+class StageTimer:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.timings: dict[str, float] = {}
+
+    async def run(self, stage: str, aw: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        try:
+            return await aw
+        finally:
+            self.timings[stage] = time.perf_counter() - start
+
+    def mark_total(self, stage: str = "total") -> None:
+        self.timings[stage] = time.perf_counter() - self.started_at
+
+
+async def _skip() -> None:
+    return None
+
+
+async def _value(value: T) -> T:
+    return value
+
+
+def _to_bytes(data: str) -> bytes:
+    return bytes.fromhex(data[2:] if data.startswith("0x") else data)
+
+
+_default_signer: Optional[OfflineSigner] = None
+
+
+def _get_default_signer() -> OfflineSigner:
+    # signing costs ~5 ms of CPU, on the event loop it would stall every concurrent swap; pass
+    # OfflineSigner(use_processes=True) to take it off the GIL as well
+    global _default_signer
+    if _default_signer is None:
+        _default_signer = OfflineSigner()
+    return _default_signer
+
+
+async def _sign(signer: Optional[OfflineSigner], from_addr: str, to_addr: str, value: int, data: bytes,
+                gas_price: int, gas_limit: int, nonce: int, chain_id: int, private_key: bytes) -> bytes:
+    tx = build_transaction(to_addr, value, data, gas_limit, nonce, chain_id, _gas_price=gas_price,
+                           _from_addr=from_addr)
+    return await (signer or _get_default_signer()).sign(tx, private_key)
+
+
+def _check_response(name: str, response: dict) -> dict:
+    if response.get("code") != "0" or not response.get("data"):
+        raise SwapError("{} failed: {} {}".format(name, response.get("code"), response.get("msg")))
+    return response["data"][0]
+
+
+async def execute_swap(client: OKXDexClient, node_url: str, chain_idx: int, swap_mode: SwapMode, amount: int,
+                       from_token_contract_addr: str, to_token_contract_addr: str, user_addr: str,
+                       spender_addr: str, slippage: Decimal, private_key: bytes,
+                       nonce_manager: Optional[NonceManager] = None, approve_amount: Optional[int] = None,
+                       signer: Optional[OfflineSigner] = None, fee_oracle: Optional[FeeOracle] = None,
+                       allowance_cache: Optional[AllowanceCache] = None, max_fee_age: float = 5.0,
+                       timeout: Optional[int] = None) -> SwapResult:
+    # spender_addr: OKX token approve address of the chain (dexTokenApproveAddress of supported/chain)
+    # for EVM chains the OKX chainIndex is the chain id used for signing
+    timer = StageTimer()
+    is_native = from_token_contract_addr.lower() == NATIVE_TOKEN_ADDR
+
+    if nonce_manager is not None:
+        nonce_aw = nonce_manager.allocate(chain_idx, user_addr)
+    else:
+        nonce_aw = rpc.check_nonce(node_url, user_addr)
+
+    # a fresh fee oracle turns the gas price lookup into a memory read, stale fee data is asked from the node
+    staleness = fee_oracle.staleness if fee_oracle is not None else None
+    if staleness is not None and staleness <= max_fee_age and fee_oracle.gas_price() is not None:
+        gas_price_aw = _value(fee_oracle.gas_price())
+    else:
+        gas_price_aw = rpc.get_gas_price(node_url)
+
+    # a loaded allowance cache answers from memory, the node is asked only on a miss
+    if is_native:
+        allowance_aw = _skip()
+    elif allowance_cache is not None:
+        allowance_aw = allowance_cache.allowance(chain_idx, from_token_contract_addr, user_addr, spender_addr)
+    else:
+        allowance_aw = rpc.check_allowance(node_url, from_token_contract_addr, user_addr, spender_addr)
+
+    # allowance, nonce, gas price and the swap transaction do not depend on each other
+    allowance, nonce, gas_price, swap = await asyncio.gather(
+        timer.run("allowance", allowance_aw),
+        timer.run("nonce", nonce_aw),
+        timer.run("gas_price", gas_price_aw),
+        timer.run("swap", client.get_aggregator_swap(chain_idx, swap_mode, amount,
+                                                     from_token_contract_addr, to_token_contract_addr,
+                                                     user_addr, slippage, timeout)),
+        return_exceptions=True,
+    )
+
+    used_nonces: list[int] = []
+    if nonce_manager is not None and isinstance(nonce, int):
+        used_nonces.append(nonce)
+    try:
+        for result in (allowance, nonce, gas_price, swap):
+            if isinstance(result, BaseException):
+                raise result
+        if nonce is None or gas_price is None or (allowance is None and not is_native):
+            raise SwapError("node {} unreachable".format(node_url))
+
+        swap_data = _check_response("swap", swap)
+        tx = swap_data["tx"]
+        from_amount = int(swap_data["routerResult"]["fromTokenAmount"])
+
+        approve_tx_hash = None
+        if not is_native and allowance < from_amount:
+            approve = _check_response("approve-transaction", await timer.run(
+                "approve_quote", client.get_approve_transaction(chain_idx, from_token_contract_addr,
+                                                                str(approve_amount or from_amount), timeout)))
+            raw_approve = await timer.run("approve_sign", _sign(
+                signer, user_addr, from_token_contract_addr, 0, _to_bytes(approve["data"]), gas_price,
+                int(approve["gasLimit"]), nonce, chain_idx, private_key))
+            approve_hash = await timer.run("approve_broadcast", rpc.broadcast_transaction(node_url, raw_approve))
+            if approve_hash is None:
+                raise SwapError("approve broadcast failed, node {} unreachable".format(node_url))
+            approve_tx_hash = "0x" + bytes(approve_hash).hex()
+            if allowance_cache is not None:
+                # the Approval log of the poller, or the next miss, brings the new value
+                allowance_cache.invalidate(chain_idx, from_token_contract_addr, user_addr, spender_addr)
+            if nonce_manager is not None:
+                nonce_manager.confirm(chain_idx, user_addr, nonce)
+                used_nonces.remove(nonce)
+                nonce = await nonce_manager.allocate(chain_idx, user_addr)
+                used_nonces.append(nonce)
+            else:
+                nonce += 1
+
+        if tx.get("gas"):
+            gas_limit = int(tx["gas"])
+        else:
+            gas_limit = await timer.run("gas_limit", rpc.estimate_gas(node_url, tx["to"], user_addr,
+                                                                      int(tx.get("value") or 0),
+                                                                      _to_bytes(tx["data"])))
+            if gas_limit is None:
+                raise SwapError("node {} unreachable".format(node_url))
+
+        raw_tx = await timer.run("sign", _sign(
+            signer, user_addr, tx["to"], int(tx.get("value") or 0), _to_bytes(tx["data"]), gas_price,
+            gas_limit, nonce, chain_idx, private_key))
+        tx_hash = await timer.run("broadcast", rpc.broadcast_transaction(node_url, raw_tx))
+        if tx_hash is None:
+            raise SwapError("broadcast failed, node {} unreachable".format(node_url))
+        if allowance_cache is not None and not is_native:
+            allowance_cache.spend(chain_idx, from_token_contract_addr, user_addr, spender_addr, from_amount,
+                                  "0x" + bytes(tx_hash).hex())
+    except BaseException:
+        if nonce_manager is not None:
+            for n in used_nonces:
+                nonce_manager.release(chain_idx, user_addr, n)
+        raise
+
+    if nonce_manager is not None:
+        nonce_manager.confirm(chain_idx, user_addr, nonce)
+    timer.mark_total()
+    return SwapResult("0x" + bytes(tx_hash).hex(), approve_tx_hash, nonce, swap, timer.timings)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    async def func(api_key: str, secret_key: str, pass_phrase: str):
+        async with OKXDexClient(api_key, secret_key, pass_phrase, timeout=10) as client:
+            r = await execute_swap(client, "https://public-bsc.nownodes.io", 56, SwapMode.exactIn, 10 ** 18,
+                                   "0x55d398326f99059ff775485246999027b3197955",
+                                   "0x8ac76a51cc950d9822d68b83fe1ad97b32cd580d",
+                                   "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A",
+                                   "0x2c34a2fb1d0b4f55de51e1d0bdefaddce6b7cdd6", Decimal("0.005"),
+                                   bytes.fromhex("1111111111111111111111111111111111111111111111111111111111111111"))
+            print(r.tx_hash, r.approve_tx_hash)
+            print(r.timings)
+        await rpc.close_nodes()
+
+
+    load_dotenv("../.env")
+    apikey = str(os.getenv("API_KEY"))
+    secretkey = str(os.getenv("API_SECRET"))
+    passphrase = str(os.getenv("API_PASSPHRASE"))
+
+    asyncio.run(func(apikey, secretkey, passphrase))
@@ -1,9 +1,15 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
+import asyncio
 import base64
 import datetime
+import hashlib
 import hmac
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import aiohttp
 
 
 # ISO-8601 format timestamp
@@ -22,3 +28,44 @@ def calc_ok_access_sign(secret_key: str, utc_ts_iso_8601: str, method: str,
     signature = hmac.new(secret_key.encode(), prehash_string.encode(), 'sha256').digest()
     ok_access_sign = base64.b64encode(signature).decode()
     return ok_access_sign
+
+
+class OkAccessSigner:
+    # keyed HMAC and header template built once per credential set, copied per request
+    def __init__(self, api_key: str, secret_key: str, pass_phrase: str):
+        self.api_key = api_key
+        self._hmac = hmac.new(secret_key.encode(), digestmod=hashlib.sha256)
+        self._headers = {
+            "OK-ACCESS-KEY": api_key,
+            "OK-ACCESS-PASSPHRASE": pass_phrase,
+        }
+        self._json_headers = dict(self._headers, **{"Content-Type": "application/json"})
+
+    def sign(self, utc_ts_iso_8601: str, method: str, request_path: str, body: bytes = b"") -> str:
+        h = self._hmac.copy()
+        h.update("".join([utc_ts_iso_8601, method, request_path]).encode())
+        if body and method != "GET":
+            h.update(body)
+        return base64.b64encode(h.digest()).decode()
+
+    def headers(self, method: str, request_path: str, body: Optional[bytes] = None) -> dict:
+        # body must be the exact bytes that are sent
+        ts_iso_8601 = get_time_now_iso_8601()
+        headers = self._headers.copy() if body is None else self._json_headers.copy()
+        headers["OK-ACCESS-SIGN"] = self.sign(ts_iso_8601, method, request_path, body or b"")
+        headers["OK-ACCESS-TIMESTAMP"] = ts_iso_8601
+        return headers
+
+
+def release_session(session: Optional["aiohttp.ClientSession"], loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    # a session of another loop cannot be awaited from this one: a loop still running closes it itself,
+    # otherwise the connections are closed here and the connector detached, no "Unclosed" warning is left
+    if session is None or session.closed:
+        return
+    if loop is not None and loop.is_running():
+        asyncio.run_coroutine_threadsafe(session.close(), loop)
+        return
+    connector = session.connector
+    session.detach()
+    if connector is not None:
+        connector._close()
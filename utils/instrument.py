@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Optional, NamedTuple, Iterable
+
+import aiohttp
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# aiohttp reports TLS as part of connection creation, so "connect" is TCP connect + TLS handshake
+PHASES = ("queue", "dns", "connect", "ttfb", "total")
+
+
+class RequestContext:
+    # per request timing state, filled in by the trace config callbacks
+    __slots__ = ("source", "endpoint", "started_at", "queue", "dns", "connect", "ttfb", "reused", "status",
+                 "_marks")
+
+    def __init__(self, source: str, endpoint: str):
+        self.source = source
+        self.endpoint = endpoint
+        self.started_at = time.perf_counter()
+        self.queue = 0.0
+        self.dns = 0.0
+        self.connect = 0.0
+        self.ttfb: Optional[float] = None
+        # None until a connection was taken, then whether it came from the pool
+        self.reused: Optional[bool] = None
+        # last HTTP status seen by the trace callbacks
+        self.status: Optional[int] = None
+        self._marks: dict[str, float] = {}
+
+
+class RequestRecord(NamedTuple):
+    source: str
+    endpoint: str
+    # HTTP status, None when no response arrived
+    status: Optional[int]
+    # API / JSON-RPC error code or exception name, None on success
+    error_code: Optional[str]
+    reused: Optional[bool]
+    # phase => seconds, ttfb is missing when no response headers arrived
+    timings: dict[str, float]
+
+
+# rpc calls go through web3, which cannot pass trace_request_ctx, the context is looked up here instead
+current_request: ContextVar[Optional[RequestContext]] = ContextVar("current_request", default=None)
+
+
+class InstrumentHook:
+    # override what is needed, hooks run inline on the event loop and must not block
+    def on_request(self, record: RequestRecord) -> None:
+        pass
+
+    def on_retry(self, source: str, endpoint: str, attempt: int, delay: float) -> None:
+        pass
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        # (le, count) pairs as prometheus expects them, the last one is +Inf
+        total = 0
+        res = []
+        for le, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            res.append(("+Inf" if le == float("inf") else repr(le), total))
+        return res
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: str) -> str:
+    return ",".join('{}="{}"'.format(k, _escape(str(v))) for k, v in labels.items())
+
+
+class Metrics(InstrumentHook):
+    # in memory aggregation of every record, exported in the prometheus text format
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS, prefix: str = "okxdex"):
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        # (source, endpoint, phase) => histogram
+        self.latency: dict[tuple[str, str, str], Histogram] = {}
+        # (source, endpoint, status) => count
+        self.requests: dict[tuple[str, str, str], int] = {}
+        # (source, endpoint, code) => count
+        self.errors: dict[tuple[str, str, str], int] = {}
+        # (source, endpoint) => count
+        self.retries: dict[tuple[str, str], int] = {}
+        # source => [new, reused]
+        self.connections: dict[str, list[int]] = {}
+
+    def on_request(self, record: RequestRecord) -> None:
+        for phase, value in record.timings.items():
+            key = (record.source, record.endpoint, phase)
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = Histogram(self.buckets)
+                self.latency[key] = histogram
+            histogram.observe(value)
+        status = str(record.status) if record.status is not None else "none"
+        key = (record.source, record.endpoint, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if record.error_code is not None:
+            key = (record.source, record.endpoint, record.error_code)
+            self.errors[key] = self.errors.get(key, 0) + 1
+        if record.reused is not None:
+            counts = self.connections.setdefault(record.source, [0, 0])
+            counts[record.reused] += 1
+
+    def on_retry(self, source: str, endpoint: str, attempt: int, delay: float) -> None:
+        self.retries[(source, endpoint)] = self.retries.get((source, endpoint), 0) + 1
+
+    def reuse_ratio(self, source: str) -> Optional[float]:
+        new, reused = self.connections.get(source, (0, 0))
+        return reused / (new + reused) if new + reused else None
+
+    def render_prometheus(self) -> str:
+        p = self.prefix
+        lines = [
+            "# HELP {}_request_duration_seconds Request latency by phase.".format(p),
+            "# TYPE {}_request_duration_seconds histogram".format(p),
+        ]
+        for (source, endpoint, phase), histogram in sorted(self.latency.items()):
+            labels = _labels(source=source, endpoint=endpoint, phase=phase)
+            for le, count in histogram.cumulative():
+                lines.append('{}_request_duration_seconds_bucket{{{},le="{}"}} {}'.format(p, labels, le, count))
+            lines.append("{}_request_duration_seconds_sum{{{}}} {}".format(p, labels, histogram.sum))
+            lines.append("{}_request_duration_seconds_count{{{}}} {}".format(p, labels, histogram.count))
+
+        lines.append("# HELP {}_requests_total Requests by HTTP status.".format(p))
+        lines.append("# TYPE {}_requests_total counter".format(p))
+        for (source, endpoint, status), count in sorted(self.requests.items()):
+            lines.append("{}_requests_total{{{}}} {}".format(
+                p, _labels(source=source, endpoint=endpoint, status=status), count))
+
+        lines.append("# HELP {}_errors_total Errors by API / JSON-RPC code or exception.".format(p))
+        lines.append("# TYPE {}_errors_total counter".format(p))
+        for (source, endpoint, code), count in sorted(self.errors.items()):
+            lines.append("{}_errors_total{{{}}} {}".format(
+                p, _labels(source=source, endpoint=endpoint, code=code), count))
+
+        lines.append("# HELP {}_retries_total Retried requests.".format(p))
+        lines.append("# TYPE {}_retries_total counter".format(p))
+        for (source, endpoint), count in sorted(self.retries.items()):
+            lines.append("{}_retries_total{{{}}} {}".format(p, _labels(source=source, endpoint=endpoint), count))
+
+        lines.append("# HELP {}_connections_total Connections taken, new or reused from the pool.".format(p))
+        lines.append("# TYPE {}_connections_total counter".format(p))
+        for source, (new, reused) in sorted(self.connections.items()):
+            lines.append("{}_connections_total{{{}}} {}".format(p, _labels(source=source, reused="false"), new))
+            lines.append("{}_connections_total{{{}}} {}".format(p, _labels(source=source, reused="true"), reused))
+
+        lines.append("# HELP {}_connection_reuse_ratio Share of requests served on a pooled connection.".format(p))
+        lines.append("# TYPE {}_connection_reuse_ratio gauge".format(p))
+        for source in sorted(self.connections):
+            lines.append("{}_connection_reuse_ratio{{{}}} {}".format(p, _labels(source=source),
+                                                                     self.reuse_ratio(source)))
+        return "\n".join(lines) + "\n"
+
+
+async def _on_request_start(session, trace_config_ctx: SimpleNamespace, params) -> None:
+    ctx = trace_config_ctx.trace_request_ctx
+    if not isinstance(ctx, RequestContext):
+        ctx = current_request.get()
+    trace_config_ctx.ctx = ctx
+
+
+def _mark(name: str):
+    async def callback(session, trace_config_ctx: SimpleNamespace, params) -> None:
+        ctx = getattr(trace_config_ctx, "ctx", None)
+        if ctx is not None:
+            ctx._marks[name] = time.perf_counter()
+    return callback
+
+
+def _span(name: str, attr: str):
+    async def callback(session, trace_config_ctx: SimpleNamespace, params) -> None:
+        ctx = getattr(trace_config_ctx, "ctx", None)
+        if ctx is not None and name in ctx._marks:
+            setattr(ctx, attr, getattr(ctx, attr) + time.perf_counter() - ctx._marks.pop(name))
+    return callback
+
+
+async def _on_connection_create_end(session, trace_config_ctx: SimpleNamespace, params) -> None:
+    ctx = getattr(trace_config_ctx, "ctx", None)
+    if ctx is not None and "connect" in ctx._marks:
+        # dns resolution runs inside connection creation
+        ctx.connect += time.perf_counter() - ctx._marks.pop("connect") - ctx._marks.pop("connect_dns", 0.0)
+        ctx.reused = False
+
+
+async def _on_dns_resolvehost_end(session, trace_config_ctx: SimpleNamespace, params) -> None:
+    ctx = getattr(trace_config_ctx, "ctx", None)
+    if ctx is not None and "dns" in ctx._marks:
+        elapsed = time.perf_counter() - ctx._marks.pop("dns")
+        ctx.dns += elapsed
+        ctx._marks["connect_dns"] = ctx._marks.get("connect_dns", 0.0) + elapsed
+
+
+async def _on_connection_reuseconn(session, trace_config_ctx: SimpleNamespace, params) -> None:
+    ctx = getattr(trace_config_ctx, "ctx", None)
+    if ctx is not None and ctx.reused is None:
+        ctx.reused = True
+
+
+async def _on_request_end(session, trace_config_ctx: SimpleNamespace, params) -> None:
+    # fired once the response headers are in, ttfb runs from the request headers being sent
+    ctx = getattr(trace_config_ctx, "ctx", None)
+    if ctx is not None:
+        if "request" in ctx._marks:
+            ctx.ttfb = time.perf_counter() - ctx._marks.pop("request")
+        ctx.status = params.response.status
+
+
+class Instrumentation:
+    # disabled instrumentation is simply None at the call sites, so there is nothing to pay for when it is off
+    def __init__(self, hooks: Iterable[InstrumentHook] = (), metrics: Optional[Metrics] = None):
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.hooks: list[InstrumentHook] = [self.metrics, *hooks]
+        self.hook_errors = 0
+
+    def add_hook(self, hook: InstrumentHook) -> None:
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: InstrumentHook) -> None:
+        self.hooks.remove(hook)
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(_on_request_start)
+        trace_config.on_connection_queued_start.append(_mark("queue"))
+        trace_config.on_connection_queued_end.append(_span("queue", "queue"))
+        trace_config.on_connection_create_start.append(_mark("connect"))
+        trace_config.on_connection_create_end.append(_on_connection_create_end)
+        trace_config.on_dns_resolvehost_start.append(_mark("dns"))
+        trace_config.on_dns_resolvehost_end.append(_on_dns_resolvehost_end)
+        trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+        trace_config.on_request_headers_sent.append(_mark("request"))
+        trace_config.on_request_end.append(_on_request_end)
+        return trace_config
+
+    def start(self, source: str, endpoint: str) -> RequestContext:
+        return RequestContext(source, endpoint)
+
+    def finish(self, ctx: RequestContext, status: Optional[int] = None, error_code: Optional[str] = None) -> None:
+        timings = {"queue": ctx.queue, "dns": ctx.dns, "connect": ctx.connect,
+                   "total": time.perf_counter() - ctx.started_at}
+        if ctx.ttfb is not None:
+            timings["ttfb"] = ctx.ttfb
+        record = RequestRecord(ctx.source, ctx.endpoint, status if status is not None else ctx.status, error_code,
+                               ctx.reused, timings)
+        for hook in self.hooks:
+            try:
+                hook.on_request(record)
+            except Exception:
+                # a broken hook must not fail the request
+                self.hook_errors += 1
+
+    def retry(self, source: str, endpoint: str, attempt: int, delay: float) -> None:
+        for hook in self.hooks:
+            try:
+                hook.on_retry(source, endpoint, attempt, delay)
+            except Exception:
+                self.hook_errors += 1
+
+    def render_prometheus(self) -> str:
+        return self.metrics.render_prometheus()
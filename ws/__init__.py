@@ -1,2 +1,310 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import asyncio
+import json
+import os
+import random
+import time
+from enum import StrEnum
+from typing import Optional, Any
+
+import aiohttp
+
+from utils import calc_ok_access_sign
+
+WS_DOMAIN_NAME = "wss://wsdex.okx.com/ws/v6/dex"
+
+ArgKey = tuple[tuple[str, str], ...]
+
+
+class OverflowPolicy(StrEnum):
+    # block: stop reading the socket until the consumer catches up
+    block: str = "block"
+    # drop_oldest: keep the newest messages, count what was dropped
+    drop_oldest: str = "drop_oldest"
+
+
+_CLOSED = object()
+
+
+def _arg_key(arg: dict) -> ArgKey:
+    return tuple(sorted((k, str(v)) for k, v in arg.items()))
+
+
+class Subscription:
+    def __init__(self, client: "WsClient", args: dict, max_queue: int, overflow: OverflowPolicy):
+        self.client = client
+        self.args = args
+        self.overflow = overflow
+        self.dropped = 0
+        self.closed = False
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # set on close, a put blocked on a full queue gives up on it
+        self._closed_event = asyncio.Event()
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> dict:
+        if self.closed and self._queue.empty():
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is _CLOSED:
+            raise StopAsyncIteration
+        return item
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def _deliver(self, msg: dict) -> None:
+        if self.closed:
+            return
+        if self.overflow == OverflowPolicy.block:
+            if not self._queue.full():
+                self._queue.put_nowait(msg)
+                return
+            # the reader waits for the consumer, or for the close of this subscription, never forever
+            put = asyncio.ensure_future(self._queue.put(msg))
+            closed = asyncio.ensure_future(self._closed_event.wait())
+            try:
+                await asyncio.wait((put, closed), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in (put, closed):
+                    if not task.done():
+                        task.cancel()
+            if not put.done() or put.cancelled():
+                self.dropped += 1
+            return
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(msg)
+
+    def _close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self._closed_event.set()
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(_CLOSED)
+
+    async def unsubscribe(self) -> None:
+        await self.client.unsubscribe(self)
+
+
+class WsClient:
+    # many subscriptions over one connection, reconnects and resubscribes on its own
+    def __init__(self, url: str = WS_DOMAIN_NAME, api_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 pass_phrase: Optional[str] = None, timeout: Optional[float] = None,
+                 proxy_url: Optional[str] = None, ping_interval: float = 20.0,
+                 reconnect_min: float = 0.5, reconnect_max: float = 30.0,
+                 max_queue: int = 1000, overflow: OverflowPolicy = OverflowPolicy.drop_oldest):
+        self.url = url
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.pass_phrase = pass_phrase
+        if timeout is None:
+            timeout = float(os.getenv("WS_CLIENT_TIMEOUT") or 5)
+        self.timeout = timeout
+        self.proxy_url = proxy_url if proxy_url is not None else os.getenv("WS_CLIENT_PROXY")
+        self.ping_interval = ping_interval
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.max_queue = max_queue
+        self.overflow = overflow
+
+        self.connects = 0
+        self.last_message_ts: Optional[float] = None
+        self.last_error: Optional[BaseException] = None
+
+        self._subs: dict[ArgKey, list[Subscription]] = {}
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        self._connected: Optional[asyncio.Event] = None
+        self._send_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None and not self._ws.closed
+
+    async def __aenter__(self) -> "WsClient":
+        try:
+            await self.connect()
+        except BaseException:
+            # a failed or timed out connect leaves no reader task or session behind
+            await self.close()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    def _create_connector(self) -> Optional[aiohttp.BaseConnector]:
+        if self.proxy_url is not None and self.proxy_url != "":
+            from aiohttp_socks import ProxyConnector
+            return ProxyConnector.from_url(self.proxy_url)
+        return None
+
+    async def connect(self) -> None:
+        if self._task is None or self._task.done():
+            self._connected = asyncio.Event()
+            self._send_lock = asyncio.Lock()
+            self._session = aiohttp.ClientSession(connector=self._create_connector())
+            self._task = asyncio.create_task(self._run())
+        await asyncio.wait_for(self._connected.wait(), self.timeout)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        for subs in self._subs.values():
+            for sub in subs:
+                sub._close()
+        self._subs.clear()
+
+    async def _send(self, msg: Any) -> None:
+        ws = self._ws
+        if ws is None or ws.closed:
+            # not connected, the reconnect loop resubscribes everything
+            return
+        async with self._send_lock:
+            if isinstance(msg, str):
+                await ws.send_str(msg)
+            else:
+                await ws.send_str(json.dumps(msg))
+
+    async def subscribe(self, args: dict, max_queue: Optional[int] = None,
+                        overflow: Optional[OverflowPolicy] = None) -> Subscription:
+        sub = Subscription(self, args, self.max_queue if max_queue is None else max_queue,
+                           self.overflow if overflow is None else overflow)
+        key = _arg_key(args)
+        subs = self._subs.setdefault(key, [])
+        subs.append(sub)
+        if len(subs) == 1:
+            await self._send({"op": "subscribe", "args": [args]})
+        return sub
+
+    async def unsubscribe(self, sub: Subscription) -> None:
+        key = _arg_key(sub.args)
+        subs = self._subs.get(key, [])
+        if sub in subs:
+            subs.remove(sub)
+        sub._close()
+        if not subs:
+            self._subs.pop(key, None)
+            await self._send({"op": "unsubscribe", "args": [sub.args]})
+
+    async def _login(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        ts = str(int(time.time()))
+        sign = calc_ok_access_sign(self.secret_key, ts, "GET", "/users/self/verify")
+        await ws.send_str(json.dumps({"op": "login", "args": [{
+            "apiKey": self.api_key,
+            "passphrase": self.pass_phrase,
+            "timestamp": ts,
+            "sign": sign,
+        }]}))
+        while True:
+            msg = await ws.receive(timeout=self.timeout)
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                raise ConnectionError("websocket closed during login")
+            if msg.data == "pong":
+                continue
+            event = json.loads(msg.data)
+            if event.get("event") == "login":
+                if str(event.get("code")) != "0":
+                    raise PermissionError("websocket login failed: {}".format(event.get("msg")))
+                return
+            if event.get("event") == "error":
+                raise PermissionError("websocket login failed: {}".format(event.get("msg")))
+
+    async def _run(self) -> None:
+        backoff = self.reconnect_min
+        while True:
+            try:
+                async with self._session.ws_connect(self.url, timeout=aiohttp.ClientWSTimeout(ws_close=self.timeout),
+                                                    autoping=True) as ws:
+                    if self.api_key is not None and self.secret_key is not None:
+                        await self._login(ws)
+                    self._ws = ws
+                    self.connects += 1
+                    if self._subs:
+                        await self._send({"op": "subscribe", "args": [subs[0].args for subs in self._subs.values()]})
+                    self._connected.set()
+                    backoff = self.reconnect_min
+                    await self._read(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                self.last_error = ex
+            finally:
+                self._ws = None
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+            backoff = min(self.reconnect_max, backoff * 2)
+
+    async def _read(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        awaiting_pong = False
+        while True:
+            try:
+                msg = await ws.receive(timeout=self.ping_interval if not awaiting_pong else self.timeout)
+            except asyncio.TimeoutError:
+                if awaiting_pong:
+                    # no pong in time, the connection is dead
+                    return
+                awaiting_pong = True
+                await self._send("ping")
+                continue
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED,
+                                aiohttp.WSMsgType.ERROR):
+                    return
+                continue
+            awaiting_pong = False
+            self.last_message_ts = time.time()
+            if msg.data == "pong":
+                continue
+            await self._dispatch(json.loads(msg.data))
+
+    async def _dispatch(self, payload: dict) -> None:
+        arg = payload.get("arg")
+        if arg is None or "data" not in payload:
+            # subscribe / unsubscribe / error events
+            return
+        subs = self._subs.get(_arg_key(arg))
+        if subs is None:
+            # pushes may carry extra fields in arg, fall back to matching the subscribed fields
+            subs = []
+            for candidates in self._subs.values():
+                if all(str(arg.get(k)) == v for k, v in _arg_key(candidates[0].args)):
+                    subs.extend(candidates)
+        for sub in list(subs):
+            if not sub.closed:
+                await sub._deliver(payload)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    async def func(api_key: str, secret_key: str, pass_phrase: str):
+        async with WsClient(api_key=api_key, secret_key=secret_key, pass_phrase=pass_phrase) as client:
+            sub = await client.subscribe({"channel": "price", "chainIndex": "1",
+                                          "tokenContractAddress": "0xeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeeee"})
+            async for msg in sub:
+                print(msg)
+
+
+    load_dotenv("../.env")
+    apikey = str(os.getenv("API_KEY"))
+    secretkey = str(os.getenv("API_SECRET"))
+    passphrase = str(os.getenv("API_PASSPHRASE"))
+
+    asyncio.run(func(apikey, secretkey, passphrase))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import asyncio
+import json
+from typing import Optional
+
+from aiohttp import web
+
+from ws import WsClient, OverflowPolicy, _arg_key, ArgKey
+
+
+class WsStubServer:
+    # local stand-in for the OKX DEX websocket: answers ping / subscribe / unsubscribe and pushes
+    # one message per subscribed arg every push_interval seconds
+    def __init__(self, push_interval: float = 0.005):
+        self.push_interval = push_interval
+        self.connections = 0
+        self.subscribe_ops = 0
+        self.unsubscribe_ops = 0
+        self._sockets: set[web.WebSocketResponse] = set()
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_get("/ws", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.url = "http://{}:{}/ws".format(host, self._runner.addresses[0][1])
+        return self.url
+
+    async def stop(self) -> None:
+        await self.drop_connections()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def drop_connections(self) -> None:
+        # server side close, the client is expected to reconnect and resubscribe
+        for ws in list(self._sockets):
+            await ws.close()
+
+    async def _handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        self._sockets.add(ws)
+        subscribed: dict[ArgKey, dict] = {}
+        pusher = asyncio.ensure_future(self._push(ws, subscribed))
+        try:
+            async for msg in ws:
+                if msg.type != web.WSMsgType.TEXT:
+                    continue
+                if msg.data == "ping":
+                    await ws.send_str("pong")
+                    continue
+                req = json.loads(msg.data)
+                for arg in req.get("args", []):
+                    if req.get("op") == "subscribe":
+                        self.subscribe_ops += 1
+                        subscribed[_arg_key(arg)] = arg
+                    elif req.get("op") == "unsubscribe":
+                        self.unsubscribe_ops += 1
+                        subscribed.pop(_arg_key(arg), None)
+                    await ws.send_str(json.dumps({"event": req.get("op"), "arg": arg}))
+        finally:
+            pusher.cancel()
+            self._sockets.discard(ws)
+        return ws
+
+    async def _push(self, ws: web.WebSocketResponse, subscribed: dict[ArgKey, dict]) -> None:
+        seq = 0
+        while not ws.closed:
+            for arg in list(subscribed.values()):
+                seq += 1
+                await ws.send_str(json.dumps({"arg": arg, "data": [{"seq": seq}]}))
+            await asyncio.sleep(self.push_interval)
+
+
+async def _drain(sub, seconds: float) -> int:
+    count = 0
+    try:
+        async with asyncio.timeout(seconds):
+            async for _ in sub:
+                count += 1
+    except TimeoutError:
+        pass
+    return count
+
+
+async def self_check() -> None:
+    # exercises the client against the stand-in, raises AssertionError on a regression
+    server = WsStubServer()
+    url = await server.start()
+    a_args = {"channel": "price", "chainIndex": "1", "tokenContractAddress": "0xa"}
+    b_args = {"channel": "price", "chainIndex": "1", "tokenContractAddress": "0xb"}
+    try:
+        async with WsClient(url, ping_interval=1, reconnect_min=0.05, max_queue=4) as client:
+            # subscribe / unsubscribe
+            sub_a = await client.subscribe(a_args)
+            assert await _drain(sub_a, 0.2) > 0, "no messages after subscribe"
+            await sub_a.unsubscribe()
+            await asyncio.sleep(0.05)
+            assert server.unsubscribe_ops == 1, "unsubscribe not sent"
+
+            # drop_oldest: an idle consumer keeps the newest max_queue messages
+            sub_d = await client.subscribe(b_args, overflow=OverflowPolicy.drop_oldest)
+            await asyncio.sleep(0.2)
+            assert sub_d.qsize() == 4 and sub_d.dropped > 0, "drop_oldest did not drop"
+            await sub_d.unsubscribe()
+
+            # block: a full subscription stalls the reader until it is closed, the others then resume
+            sub_b = await client.subscribe(a_args, overflow=OverflowPolicy.block)
+            sub_other = await client.subscribe(b_args, overflow=OverflowPolicy.drop_oldest, max_queue=10000)
+            await asyncio.sleep(0.1)
+            assert sub_b.qsize() == 4, "block policy overfilled the queue"
+            await sub_b.unsubscribe()
+            before = sub_other.qsize()
+            await asyncio.sleep(0.2)
+            assert sub_other.qsize() - before > 10, "reader stuck after closing a blocked subscription"
+
+            # reconnect and resubscribe
+            connects = client.connects
+            await server.drop_connections()
+            await asyncio.sleep(0.5)
+            assert client.connects > connects, "no reconnect"
+            before = sub_other.qsize()
+            await asyncio.sleep(0.2)
+            assert sub_other.qsize() > before, "no messages after resubscribe"
+            await sub_other.unsubscribe()
+    finally:
+        await server.stop()
+    print("ws stub self check passed: {} connections, {} subscribe / {} unsubscribe ops".format(
+        server.connections, server.subscribe_ops, server.unsubscribe_ops))
+
+
+if __name__ == "__main__":
+    asyncio.run(self_check())